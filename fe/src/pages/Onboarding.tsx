@@ -23,6 +23,23 @@ interface Info {
     description: string;
 }
 
+interface Progress {
+    index: number;
+    total: number;
+}
+
+// 서버가 항목 단위로 보내는 생성 결과 (부모 uuid 기준으로 모아둠)
+type ItemsByParent = { [parentUuid: string]: { level: string; item: any }[] };
+
+// 부모 uuid 로 모아둔 항목들을 계층 트리로 조립
+const attachChildren = (node: any, itemsByParent: ItemsByParent): any => {
+    (itemsByParent[node.uuid] || []).forEach(({ level, item }) => {
+        node[level] = node[level] || [];
+        node[level].push(attachChildren({ ...item }, itemsByParent));
+    });
+    return node;
+};
+
 const Onboarding: React.FC = () => {
     const navigate = useNavigate();
     const swiperRef = useRef<SwiperCore>();
@@ -34,6 +51,8 @@ const Onboarding: React.FC = () => {
     const [styles, setStyles] = useState<Style[]>([]);
     const [selectedStyles, setSelectedStyles] = useState<number[]>([]);
     const [result, setResult] = useState<any>(null);
+    const [progress, setProgress] = useState<{ [level: string]: Progress }>({});
+    const itemsRef = useRef<ItemsByParent>({});
 
     useEffect(() => {
         if (swiperRef.current) {
@@ -54,6 +73,25 @@ const Onboarding: React.FC = () => {
 
         websocket.onmessage = (event) => {
             const data = JSON.parse(event.data);
+
+            if (data.type === 'item') {
+                const siblings = itemsRef.current[data.parent_uuid] || [];
+                siblings.push({ level: data.level, item: data.item });
+                itemsRef.current[data.parent_uuid] = siblings;
+                setProgress((prev) => ({ ...prev, [data.level]: data.progress }));
+                return;
+            }
+
+            if (data.type === 'topic_delta' || data.type === 'topic_reset') {
+                return;
+            }
+
+            if (data.type === 'complete') {
+                const root = attachChildren({ ...data.root }, itemsRef.current);
+                setResult({ [data.category]: [root] });
+                return;
+            }
+
             console.log('WebSocket message:', data);
 
             if (data.example) {
@@ -175,7 +213,10 @@ const Onboarding: React.FC = () => {
                         <div className="text-center">
                             <h2 className="text-3xl font-bold mb-4">Result</h2>
                             {/* <p className="text-lg text-base-content mb-4">{typeof result === 'object' ? JSON.stringify(result) : result}</p> */}
-                            <p className="text-lg text-base-content mb-4">학습 자료가 생성되고있습니다.</p>
+                            <p className="text-lg text-base-content mb-4">{result ? '학습 자료가 생성되었습니다.' : '학습 자료가 생성되고있습니다.'}</p>
+                            {Object.entries(progress).map(([level, { index, total }]) => (
+                                <p key={level} className="text-sm text-base-content mb-1">{level}: {index}/{total}</p>
+                            ))}
                             <button className="btn btn-primary" onClick={() => swiperRef.current?.slidePrev()}>Prev</button>
                             <button className="btn btn-primary" onClick={() => {
                                 if (info && userId) {
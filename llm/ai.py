@@ -1,13 +1,14 @@
 import os
+import re
+import json
 import uuid
-import requests
 import logging
-import nest_asyncio
+import time
 import asyncio
 
 from typing import List, Literal, Any, TypedDict
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, create_model
 
 from langchain.chains import create_extraction_chain
 from langchain.prompts import PromptTemplate, ChatPromptTemplate
@@ -15,14 +16,32 @@ from langchain.prompts import PromptTemplate, ChatPromptTemplate
 from langgraph.graph import StateGraph, START, END
 from langgraph.checkpoint.memory import MemorySaver
 
+import openai
+
 from langchain_openai import ChatOpenAI
+from langchain_core.output_parsers.openai_tools import JsonOutputKeyToolsParser
 
-from langchain_community.document_loaders import AsyncChromiumLoader
-from langchain_community.document_transformers import BeautifulSoupTransformer
+from langchain_core.documents import Document
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from dotenv import load_dotenv
 
+from scheduler import (
+    scheduler,
+    current_session,
+    backoff_delay,
+    estimate_tokens,
+    INTERACTIVE,
+    NORMAL,
+    BULK,
+)
+from llm_cache import llm_cache, make_key, strip_uuids
+from events import emit, has_channel
+from latency import latency_tracker
+from speculation import speculations
+from page_fetch import page_fetcher
+from web_search import search_client
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
@@ -30,10 +49,6 @@ logger = logging.getLogger("WebSocket")
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL_NAME = os.getenv("OPENAI_MODEL_NAME")
-CSE_API_KEY = os.getenv("CSE_API_KEY")
-CSE_ID = os.getenv("CSE_ID")
-
-nest_asyncio.apply()
 
 CURRICULUM_SUMMARY = """
 # 교육 프로그램 계층 구조 요약
@@ -74,6 +89,213 @@ CATEGORIES = (
 )
 
 
+# 템플릿 본문 등 입력 값 외에 프롬프트에 더해지는 토큰 수 (대략치)
+PROMPT_OVERHEAD_TOKENS = 500
+
+# 429/타임아웃/과부하 응답을 받았을 때 재시도 횟수 (재시도는 스케줄러를 다시 거침)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+
+# 호출 한 번의 최대 시간(초), 넘으면 타임아웃으로 보고 재시도
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE_SECONDS", "120"))
+
+# 헤지 요청: 지정한 노드의 호출이 최근 응답 시간의 LLM_HEDGE_PERCENTILE 백분위를 넘기면
+# 같은 요청을 하나 더 보내고 먼저 성공한 결과를 사용 (나머지는 취소)
+HEDGE_NODES = {
+    node.strip()
+    for node in os.getenv("LLM_HEDGE_NODES", "").split(",")
+    if node.strip()
+}
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+
+
+class StructuredChain:
+    # 프롬프트 | 구조화 출력 LLM 체인 (캐시 키 계산을 위해 구성 요소를 함께 보관)
+    def __init__(self, prompt, schema, model_name="gpt-4o-mini"):
+        self.prompt = prompt
+        self.schema = schema
+        self.model_name = model_name
+        self.schema_json = json.dumps(
+            schema.model_json_schema(), sort_keys=True, ensure_ascii=False
+        )
+        # 재시도는 call_llm 에서 스케줄러의 동시 실행 창과 함께 처리
+        llm = ChatOpenAI(model_name=model_name, max_retries=0).with_structured_output(
+            schema
+        )
+        self.runnable = prompt | llm
+        self._stream_runnable = None
+
+    def cache_key(self, inputs):
+        prompt_text = self.prompt.format(**strip_uuids(inputs))
+        return make_key(self.model_name, prompt_text, self.schema_json)
+
+    async def ainvoke(self, inputs):
+        return await self.runnable.ainvoke(inputs)
+
+    async def astream(self, inputs, on_partial):
+        # 도구 호출 인자를 토큰 단위로 받아, 지금까지 파싱된 부분 결과를 on_partial 로 전달
+        if self._stream_runnable is None:
+            name = self.schema.__name__
+            llm = ChatOpenAI(model_name=self.model_name, max_retries=0).bind_tools(
+                [self.schema], tool_choice=name
+            )
+            parser = JsonOutputKeyToolsParser(key_name=name, first_tool_only=True)
+            self._stream_runnable = self.prompt | llm | parser
+
+        partial = None
+        async for partial in self._stream_runnable.astream(inputs):
+            on_partial(partial)
+        return self.schema.model_validate(partial)
+
+
+def parse_duration(value):
+    # Retry-After 초 값 또는 x-ratelimit-reset-* 형식("1s", "6m0s", "250ms")을 초로 변환
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    seconds = 0.0
+    for amount, unit in re.findall(r"([\d.]+)(ms|s|m|h)", value):
+        seconds += float(amount) * units[unit]
+    return seconds or None
+
+
+def overload_signal(error):
+    """재시도할 과부하 오류면 (Retry-After 초 또는 None) 을, 아니면 False 를 반환."""
+    if isinstance(error, openai.RateLimitError):
+        if getattr(error, "code", None) == "insufficient_quota":
+            return False
+        headers = error.response.headers if error.response is not None else {}
+        return parse_duration(
+            headers.get("retry-after")
+            or headers.get("x-ratelimit-reset-requests")
+            or headers.get("x-ratelimit-reset-tokens")
+        )
+    if isinstance(
+        error,
+        (
+            openai.APITimeoutError,
+            openai.APIConnectionError,
+            openai.InternalServerError,
+            asyncio.TimeoutError,
+        ),
+    ):
+        return None
+    return False
+
+
+async def invoke_once(chain, inputs, node, priority, tokens, on_partial, started=None):
+    # 스케줄러 슬롯을 받은 뒤 한 번 호출, 슬롯을 받은 뒤부터 걸린 시간을 기록
+    async with scheduler.slot(priority, tokens):
+        if started is not None:
+            started.set()
+        begin = time.monotonic()
+        try:
+            if on_partial is not None and isinstance(chain, StructuredChain):
+                call = chain.astream(inputs, on_partial)
+            else:
+                call = chain.ainvoke(inputs)
+            res = await asyncio.wait_for(call, LLM_DEADLINE)
+        except asyncio.TimeoutError:
+            latency_tracker.count(node, "timeouts")
+            raise
+    latency_tracker.record(node, time.monotonic() - begin)
+    return res
+
+
+async def invoke_hedged(chain, inputs, node, priority, tokens, on_partial):
+    # 첫 요청이 기준 시간 안에 끝나지 않으면 같은 요청을 하나 더 보냄 (스트리밍 호출은 제외)
+    threshold = None
+    if node in HEDGE_NODES and on_partial is None:
+        threshold = latency_tracker.percentile(node, HEDGE_PERCENTILE)
+    if threshold is None:
+        return await invoke_once(chain, inputs, node, priority, tokens, on_partial)
+
+    started = asyncio.Event()
+    first = asyncio.create_task(
+        invoke_once(chain, inputs, node, priority, tokens, None, started)
+    )
+    tasks = {first}
+    try:
+        # 대기열에서 기다리는 시간은 빼고, 실제 호출이 시작된 뒤부터 기준 시간을 잼
+        waiter = asyncio.create_task(started.wait())
+        await asyncio.wait({first, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        done, _ = await asyncio.wait({first}, timeout=threshold)
+        if not done:
+            latency_tracker.count(node, "hedges")
+            tasks.add(
+                asyncio.create_task(
+                    invoke_once(chain, inputs, node, priority, tokens, None)
+                )
+            )
+
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        latency_tracker.count(node, "hedge_wins")
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def call_llm(
+    chain,
+    inputs,
+    node,
+    priority=NORMAL,
+    max_output_tokens=1000,
+    cache=True,
+    on_partial=None,
+    on_reset=None,
+):
+    # 모든 LLM 호출은 전역 스케줄러를 거쳐 요청 수/토큰 한도와 우선순위를 지킵니다.
+    # 구조화 출력 체인은 동일한 프롬프트에 대한 응답을 캐시에서 재사용합니다.
+    # on_partial 을 주면 생성 중인 부분 결과를 받아볼 수 있습니다.
+    # on_reset 은 시도가 실패할 때마다 (재시도 전에) 호출되어 그때까지 받은 부분 결과를 버리게 합니다.
+    key = None
+    if cache and isinstance(chain, StructuredChain) and llm_cache.is_enabled(node):
+        key = chain.cache_key(inputs)
+        cached = await llm_cache.get(key, node)
+        if cached is not None:
+            if on_partial is not None:
+                on_partial(cached)
+            # uuid 는 저장하지 않으므로 검증 과정에서 새로 발급됩니다.
+            return chain.schema.model_validate(cached)
+
+    tokens = estimate_tokens(str(inputs)) + PROMPT_OVERHEAD_TOKENS + max_output_tokens
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            res = await invoke_hedged(chain, inputs, node, priority, tokens, on_partial)
+            scheduler.on_success()
+            break
+        except Exception as e:
+            if on_reset is not None:
+                on_reset()
+            retry_after = overload_signal(e)
+            if retry_after is False:
+                raise
+            scheduler.on_overload(retry_after)
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt, retry_after)
+            logger.warning(f"{node}: {type(e).__name__}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    if key is not None:
+        await llm_cache.put(key, node, strip_uuids(res.dict()))
+    return res
+
+
 class State(TypedDict):
     input: str
     goal: str
@@ -95,7 +317,7 @@ class State(TypedDict):
     info: str
 
 
-def classify_input(state):
+async def classify_input(state):
     class Result(BaseModel):
         goal: str = Field(..., description="문장의 제목")
         content: str = Field(..., description="제목의 내용")
@@ -120,14 +342,15 @@ def classify_input(state):
         """
     )
 
-    llm = ChatOpenAI(model_name="gpt-4o-mini").with_structured_output(Result)
-
-    chain = prompt | llm
-    res = chain.invoke(
+    chain = StructuredChain(prompt, Result)
+    res = await call_llm(
+        chain,
         {
             "background": CURRICULUM_SUMMARY,
             "input": state.get("input"),
-        }
+        },
+        node="Classify",
+        priority=INTERACTIVE,
     )
     res = res.dict()
     state["goal"] = res["goal"]
@@ -144,7 +367,7 @@ def classify_input(state):
     return state
 
 
-def select_example(state):
+async def select_example(state):
     class Result(BaseModel):
         subject: str = Field(..., description="주제에 대해 설명할 일부 소주제")
         description: str = Field(..., description="소주제에 대한 간략한 설명")
@@ -161,16 +384,20 @@ def select_example(state):
     """
 
     prompt = ChatPromptTemplate.from_template(template)
-    llm = ChatOpenAI(model_name="gpt-4o-mini").with_structured_output(Result)
-    chain = prompt | llm
-    res = chain.invoke({"goal": state.get("goal")})
+    chain = StructuredChain(prompt, Result)
+    res = await call_llm(
+        chain,
+        {"goal": state.get("goal")},
+        node="SelectExample",
+        priority=INTERACTIVE,
+    )
 
     res = res.dict()
 
     return {"example": res}
 
 
-def recommend_style_by_llm(state):
+async def recommend_style_by_llm(state):
     class Style(BaseModel):
         title: str = Field(..., description="스타일 제목")
         description: str = Field(..., description="스타일 설명")
@@ -193,45 +420,35 @@ def recommend_style_by_llm(state):
     {example}
     """
     prompt = ChatPromptTemplate.from_template(template)
-    llm = ChatOpenAI(model_name="gpt-4o-mini").with_structured_output(Result)
-    chain = prompt | llm
+    chain = StructuredChain(prompt, Result)
 
     example = state["example"]
-    res = chain.invoke({"example": example})
+    res = await call_llm(
+        chain,
+        {"example": example},
+        node="RecommendStyleByLLM",
+        priority=INTERACTIVE,
+        max_output_tokens=3000,
+    )
     res = res.dict()
 
     return {"llm_styles": res["styles"]}
 
 
-def scrap_blog(state):
-    query = state["goal"]
-
-    sites = ["tistory.com", "velog.io"]
-    site_query = " OR ".join([f"site:{site}" for site in sites])
-
-    params = {"key": CSE_API_KEY, "cx": CSE_ID, "q": f"{query} {site_query}"}
+# 스타일 예시를 찾을 블로그 사이트
+BLOG_SITES = ["tistory.com", "velog.io"]
 
-    response = requests.get("https://www.googleapis.com/customsearch/v1", params=params)
 
-    if response.status_code == 200:
-        json_response = response.json()
-        links = []
+async def scrap_blog(state):
+    # 같은 goal 의 검색 결과는 캐시에서 바로 가져옴
+    links = await search_client.search_links(state["goal"], BLOG_SITES)
+    if not links:
+        logger.info("검색 결과가 없습니다.")
+    return {"blogs": links}
 
-        if "items" in json_response:
-            for item in json_response["items"]:
-                link = item["link"]
 
-                links.append(link)
-        else:
-            print("검색 결과가 없습니다.")
-
-        return {"blogs": links}
-    else:
-        print(f"Error: {response.status_code}")
-
-
-def extract_insight(state):
-    llm = ChatOpenAI(model_name="gpt-4o-mini")
+async def extract_insight(state):
+    llm = ChatOpenAI(model_name="gpt-4o-mini", max_retries=0)
 
     schema = {
         "properties": {
@@ -251,18 +468,19 @@ def extract_insight(state):
     )
 
     urls = state["blogs"][:5]
-    loader = AsyncChromiumLoader(urls)
-    docs = loader.load()
-    bs_transformer = BeautifulSoupTransformer()
-    docs_transformed = bs_transformer.transform_documents(
-        docs, tags_to_extract=["span"]
-    )
+    # 정적 HTML 에서 <span> 본문을 먼저 뽑고, 본문이 부족한 페이지만 브라우저 풀에서 렌더링
+    pages = await page_fetcher.fetch_many(urls)
+    docs = [Document(page_content=text, metadata={"source": url}) for url, text in pages]
+
+    def split_documents(docs):
+        # Grab the first 1000 tokens of the site
+        splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            chunk_size=1000, chunk_overlap=0
+        )
+        return splitter.split_documents(docs)
 
-    # Grab the first 1000 tokens of the site
-    splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-        chunk_size=1000, chunk_overlap=0
-    )
-    splits = splitter.split_documents(docs_transformed)
+    # 토큰 분할은 CPU 작업이므로 이벤트 루프 밖에서 실행
+    splits = await asyncio.to_thread(split_documents, docs)
 
     # extracted_contents = []
 
@@ -274,19 +492,13 @@ def extract_insight(state):
     # state["extracted_insights"] = extracted_content
 
     async def create(chain, content):
-        return await chain.ainvoke(content)
+        return await call_llm(chain, content, node="ExtractInsight", priority=NORMAL)
 
-    async def gather_results():
-        tasks = []
-        for split in splits:
-            chain = create_extraction_chain(
-                schema=schema, llm=llm, prompt=prompt_template
-            )
-            tasks.append(create(chain, split))
-        task_results = await asyncio.gather(*tasks)
-        return task_results
-
-    task_results = asyncio.run(gather_results())
+    tasks = []
+    for split in splits:
+        chain = create_extraction_chain(schema=schema, llm=llm, prompt=prompt_template)
+        tasks.append(create(chain, split))
+    task_results = await asyncio.gather(*tasks)
 
     extracted_content = []
     for res in task_results:
@@ -297,7 +509,7 @@ def extract_insight(state):
     return {"extracted_insights": extracted_content}
 
 
-def recommend_style_by_blog(state):
+async def recommend_style_by_blog(state):
     class Style(BaseModel):
         title: str = Field(..., description="스타일 제목")
         description: str = Field(..., description="스타일 설명")
@@ -322,17 +534,22 @@ def recommend_style_by_blog(state):
     {example}
     """
     prompt = ChatPromptTemplate.from_template(template)
-    llm = ChatOpenAI(model_name="gpt-4o-mini").with_structured_output(Result)
-    chain = prompt | llm
+    chain = StructuredChain(prompt, Result)
 
     example = state["extracted_insights"]
-    res = chain.invoke({"example": example})
+    res = await call_llm(
+        chain,
+        {"example": example},
+        node="RecommendStyleByBlog",
+        priority=NORMAL,
+        max_output_tokens=3000,
+    )
     res = res.dict()
 
     return {"web_styles": res["styles"]}
 
 
-def collect_data(state):
+async def collect_data(state):
     class Style(BaseModel):
         title: str = Field(..., description="스타일 제목")
         description: str = Field(..., description="스타일 설명")
@@ -353,19 +570,25 @@ def collect_data(state):
     """
 
     prompt = ChatPromptTemplate.from_template(template)
-    llm = ChatOpenAI(model_name="gpt-4o-mini").with_structured_output(Result)
-    chain = prompt | llm
+    chain = StructuredChain(prompt, Result)
 
     example = state["web_styles"]
     styles = state["llm_styles"]
-    res = chain.invoke({"styles": styles, "example": example})
+    res = await call_llm(
+        chain,
+        {"styles": styles, "example": example},
+        node="CollectData",
+        priority=INTERACTIVE,
+        max_output_tokens=2000,
+    )
     res = res.dict()
 
     state["styles"] = res["styles"]
     return state
 
 
-def handle_curriculum(state):
+def build_curriculum_chain():
+    # 프로그램 → 커리큘럼 생성 체인
     class Curriculum(BaseModel):
         uuid: str = Field(
             default_factory=lambda: str(uuid.uuid4()),
@@ -418,38 +641,11 @@ def handle_curriculum(state):
         """
     )
 
-    llm = ChatOpenAI(model_name="gpt-4o-mini").with_structured_output(Result)
-    chain = prompt | llm
+    return StructuredChain(prompt, Result)
 
-    async def create(chain, program, goal):
-        return await chain.ainvoke(
-            {
-                "program": program,
-                "goal": goal,
-            }
-        )
 
-    async def gather_results():
-        tasks = []
-        programs = []
-        for sub in state["programs"].values():
-            programs.extend(sub)
-        for program in programs:
-            tasks.append(create(chain, program, state.get("goal")))
-        task_results = await asyncio.gather(*tasks)
-        return task_results, programs
-
-    task_results, programs = asyncio.run(gather_results())
-
-    result = {}
-    for program, res in zip(programs, task_results):
-        curriculums = res.dict()["curriculums"]
-        result[program["uuid"]] = curriculums
-
-    return {"curriculums": result}
-
-
-def handle_subject(state):
+def build_subject_chain():
+    # 커리큘럼 → 과목 생성 체인
     class Subject(BaseModel):
         uuid: str = Field(
             default_factory=lambda: str(uuid.uuid4()),
@@ -498,40 +694,11 @@ def handle_subject(state):
         """
     )
 
-    llm = ChatOpenAI(model_name="gpt-4o-mini").with_structured_output(Result)
-    chain = prompt | llm
-
-    result = dict()
+    return StructuredChain(prompt, Result)
 
-    curriculums = []
-    for sub in state["curriculums"].values():
-        curriculums.extend(sub)
 
-    async def create(chain, curriculum, goal):
-        return await chain.ainvoke(
-            {
-                "curriculum": curriculum,
-                "goal": goal,
-            }
-        )
-
-    async def gather_results():
-        tasks = []
-        for curriculum in curriculums:
-            tasks.append(create(chain, curriculum, state.get("goal")))
-        task_results = await asyncio.gather(*tasks)
-        return task_results
-
-    task_results = asyncio.run(gather_results())
-
-    for curriculum, res in zip(curriculums, task_results):
-        subjects = res.dict()["subjects"]
-        result[curriculum["uuid"]] = subjects
-
-    return {"subjects": result}
-
-
-def handle_module(state):
+def build_module_chain():
+    # 과목 → 모듈 생성 체인
     class Module(BaseModel):
         uuid: str = Field(
             default_factory=lambda: str(uuid.uuid4()),
@@ -581,40 +748,11 @@ def handle_module(state):
         """
     )
 
-    llm = ChatOpenAI(model_name="gpt-4o-mini").with_structured_output(Result)
-    chain = prompt | llm
-
-    result = dict()
-
-    subjects = []
-    for sub in state["subjects"].values():
-        subjects.extend(sub)
-
-    async def create(chain, subject, goal):
-        return await chain.ainvoke(
-            {
-                "subject": subject,
-                "goal": goal,
-            }
-        )
-
-    async def gather_results():
-        tasks = []
-        for subject in subjects:
-            tasks.append(create(chain, subject, state.get("goal")))
-        task_results = await asyncio.gather(*tasks)
-        return task_results
-
-    task_results = asyncio.run(gather_results())
+    return StructuredChain(prompt, Result)
 
-    for module, res in zip(subjects, task_results):
-        modules = res.dict()["modules"]
-        result[module["uuid"]] = modules
 
-    return {"modules": result}
-
-
-def handle_lesson(state):
+def build_lesson_chain():
+    # 모듈 → 레슨 생성 체인
     class Lesson(BaseModel):
         uuid: str = Field(
             default_factory=lambda: str(uuid.uuid4()),
@@ -668,54 +806,11 @@ def handle_lesson(state):
         """
     )
 
-    llm = ChatOpenAI(model_name="gpt-4o-mini").with_structured_output(Result)
-    chain = prompt | llm
-
-    # 동시 실행 작업 제한
-
-    semaphore = asyncio.Semaphore(10)  # 동시에 최대 10개의 작업만 허용
-
-    async def create(chain, module, goal, index, total):
-        async with semaphore:  # 세마포어로 동시 작업 제한
-            logger.info(f"진행 중: {index}/{total} - {module}")
-            result = await chain.ainvoke(
-                {
-                    "module": module,
-                    "goal": goal,
-                }
-            )
-            logger.info(f"완료됨: {index}/{total} - {module}")
-            return result
-
-    async def gather_results():
-        tasks = []
-        modules = []
-
-        # state에서 모듈 가져오기
-        for sub in state["modules"].values():
-            modules.extend(sub)
-
-        total_modules = len(modules)  # 총 모듈 수 계산
-
-        # 각 모듈에 대해 작업 생성
-        for index, module in enumerate(modules, 1):
-            tasks.append(create(chain, module, state.get("goal"), index, total_modules))
-
-        task_results = await asyncio.gather(*tasks)
-        logger.info("모든 작업 완료")
-        return task_results, modules
-
-    task_results, modules = asyncio.run(gather_results())
-
-    result = {}
-    for module, res in zip(modules, task_results):
-        lessons = res.dict()["lessons"]
-        result[module["uuid"]] = lessons
-
-    return {"lessons": result}
+    return StructuredChain(prompt, Result)
 
 
-def handle_topic(state):
+def build_topic_chain():
+    # 레슨 → 주제 생성 체인
     class Data(BaseModel):
         uuid: str = Field(
             default_factory=lambda: str(uuid.uuid4()),
@@ -765,69 +860,448 @@ def handle_topic(state):
         """
     )
 
-    llm = ChatOpenAI(model_name="gpt-4o-mini").with_structured_output(Result)
-    chain = prompt | llm
-
-    # async def create(chain, lesson, goal):
-    #     result = await chain.ainvoke(
-    #         {
-    #             "lesson": lesson,
-    #             "goal": goal,
-    #         }
-    #     )
-    #     logger.info("요청 처리됨")
-    #     return result
-
-    # async def gather_results():
-    #     tasks = []
-    #     lessons = []
-    #     for sub in state["lessons"].values():
-    #         lessons.extend(sub)
-    #     for lesson in lessons:
-    #         tasks.append(create(chain, lesson, state.get("goal")))
-    #     task_results = await asyncio.gather(*tasks)
-    #     return task_results, lessons
-
-    # 동시 실행 작업 제한
-    semaphore = asyncio.Semaphore(10)  # 동시에 최대 10개의 작업만 허용
-
-    async def create(chain, lesson, goal, index, total):
-        async with semaphore:  # 세마포어로 동시 작업 제한
-            logger.info(f"진행 중: {index}/{total} - {lesson}")
-            result = await chain.ainvoke(
-                {
-                    "lesson": lesson,
-                    "goal": goal,
-                }
+    return StructuredChain(prompt, Result)
+
+
+# 부모 계층 → (자식 계층, 프롬프트 변수명, 체인 생성 함수)
+CHILD_LEVELS = {
+    "programs": ("curriculums", "program", build_curriculum_chain),
+    "curriculums": ("subjects", "curriculum", build_subject_chain),
+    "subjects": ("modules", "subject", build_module_chain),
+    "modules": ("lessons", "module", build_lesson_chain),
+    "lessons": ("topics", "lesson", build_topic_chain),
+}
+
+# 자식 계층 → 그래프 노드 이름
+LEVEL_NODES = {
+    "curriculums": "Curriculum",
+    "subjects": "Subject",
+    "modules": "Module",
+    "lessons": "Lesson",
+    "topics": "Topic",
+}
+
+# 형제 항목 여러 개의 자식을 한 번의 호출로 생성할 계층과 묶음 크기 (1 이면 항목마다 호출)
+# 묶음 호출에서는 주제 내용을 스트리밍하지 않습니다.
+BATCH_LEVELS = {
+    level.strip()
+    for level in os.getenv("LLM_BATCH_LEVELS", "lessons,topics").split(",")
+    if level.strip()
+}
+BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "1"))
+
+BATCH_PROMPT_SUFFIX = """
+    위 지침을 아래 목록의 각 항목에 대해 따로 수행하세요.
+    results 에 항목마다 결과를 하나씩 담고, parent_index 에는 그 항목의 index 를 적으세요.
+
+    목록:
+    {parents}
+    """
+
+
+def build_batch_chain(single, parent_key):
+    # 단일 항목 체인의 프롬프트와 출력 스키마로 여러 부모를 한 번에 처리하는 체인 구성
+    child_key, variable, _ = CHILD_LEVELS[parent_key]
+    item_type = single.schema.model_fields[child_key].annotation
+    Entry = create_model(
+        "Entry",
+        parent_index=(int, Field(description="목록에서 부모 항목의 index")),
+        **{child_key: (item_type, Field(description="부모 항목에 대한 결과"))},
+    )
+
+    class Result(BaseModel):
+        results: List[Entry] = Field(description="부모 항목별 결과")
+
+    template = single.prompt.messages[0].prompt.template.replace(
+        "{" + variable + "}", "아래 목록의 각 항목"
+    )
+    prompt = ChatPromptTemplate.from_template(template + BATCH_PROMPT_SUFFIX)
+    return StructuredChain(prompt, Result, model_name=single.model_name)
+
+
+class LevelChains:
+    # 계층별 단일/묶음 체인을 처음 사용할 때 한 번만 생성
+    def __init__(self):
+        self._single = {}
+        self._batch = {}
+
+    def single(self, parent_key):
+        if parent_key not in self._single:
+            self._single[parent_key] = CHILD_LEVELS[parent_key][2]()
+        return self._single[parent_key]
+
+    def batch(self, parent_key):
+        if parent_key not in self._batch:
+            self._batch[parent_key] = build_batch_chain(
+                self.single(parent_key), parent_key
             )
-            logger.info(f"완료됨: {index}/{total} - {lesson}")
-            return result
+        return self._batch[parent_key]
+
+
+def split_groups(parent_key, parents):
+    # 묶음 모드인 계층이면 BATCH_SIZE 개씩, 아니면 항목 하나씩
+    if BATCH_SIZE > 1 and CHILD_LEVELS[parent_key][0] in BATCH_LEVELS:
+        return [
+            parents[i : i + BATCH_SIZE] for i in range(0, len(parents), BATCH_SIZE)
+        ]
+    return [[parent] for parent in parents]
+
+
+# 주제 내용을 생성되는 대로 WebSocket 으로 전송할지 여부
+TOPIC_STREAMING = os.getenv("TOPIC_STREAMING", "1") == "1"
+
+# 계층 생성 방식: "dataflow" 는 부모 항목이 끝나는 즉시 자식 생성을 시작하고,
+# "level" 은 계층 전체가 끝난 뒤 다음 계층으로 넘어갑니다.
+HIERARCHY_MODE = os.getenv("HIERARCHY_MODE", "dataflow")
+
+
+class TopicStream:
+    # 레슨 하나의 주제 생성 결과를 부분 파싱해 새로 추가된 내용만 전송
+    def __init__(self, lesson_uuid):
+        self.lesson_uuid = lesson_uuid
+        self.topic_uuids = []
+        self.sent = []
+
+    def reset(self):
+        # 실패한 시도에서 이미 보낸 내용은 클라이언트가 지우도록 알리고, 다음 시도는 처음부터 보냄
+        if self.topic_uuids:
+            emit({"type": "topic_reset", "lesson_uuid": self.lesson_uuid})
+        self.topic_uuids = []
+        self.sent = []
+
+    def on_partial(self, partial):
+        for index, topic in enumerate((partial or {}).get("topics") or []):
+            if not isinstance(topic, dict):
+                continue
+            if index == len(self.topic_uuids):
+                # 스트리밍 중에 붙인 uuid 를 최종 결과에서도 그대로 사용
+                self.topic_uuids.append(str(uuid.uuid4()))
+                self.sent.append(0)
+            content = topic.get("content") or ""
+            if len(content) > self.sent[index]:
+                emit(
+                    {
+                        "type": "topic_delta",
+                        "lesson_uuid": self.lesson_uuid,
+                        "topic_uuid": self.topic_uuids[index],
+                        "name": topic.get("name"),
+                        "delta": content[self.sent[index] :],
+                    }
+                )
+                self.sent[index] = len(content)
+
+    def assign_uuids(self, topics):
+        for topic, topic_uuid in zip(topics, self.topic_uuids):
+            topic["uuid"] = topic_uuid
+
+
+class Progress:
+    # 계층별 LLM 호출 진행 상황 (완료 수 / 지금까지 알려진 전체 수)
+    def __init__(self):
+        self.done = {}
+        self.total = {}
+
+    def add(self, level, count):
+        self.total[level] = self.total.get(level, 0) + count
+
+    def complete(self, level):
+        self.done[level] = self.done.get(level, 0) + 1
+        return {"index": self.done[level], "total": self.total.get(level, 0)}
+
+
+def emit_items(level, parent_uuid, items, progress):
+    # 완료된 항목을 부모 uuid 와 함께 하나씩 전송
+    for item in items:
+        emit(
+            {
+                "type": "item",
+                "level": level,
+                "parent_uuid": parent_uuid,
+                "item": item,
+                "progress": progress,
+            }
+        )
 
-    async def gather_results():
-        tasks = []
-        lessons = []
-        for sub in state["lessons"].values():
-            lessons.extend(sub)
 
-        total_lessons = len(lessons)
+def level_budget(child_key):
+    # 주제(topic) 대량 생성은 낮은 우선순위로, 나머지 계층은 일반 우선순위로 요청
+    if child_key == "topics":
+        return BULK, 4000
+    return NORMAL, 1000
 
-        for index, lesson in enumerate(lessons, 1):
-            tasks.append(create(chain, lesson, state.get("goal"), index, total_lessons))
 
-        task_results = await asyncio.gather(*tasks)
-        logger.info("모든 작업 완료")
-        return task_results, lessons
+async def generate_children(chain, parent_key, parent, goal, progress, cache=True):
+    child_key, variable, _ = CHILD_LEVELS[parent_key]
+    priority, max_output_tokens = level_budget(child_key)
 
-    task_results, lessons = asyncio.run(gather_results())
+    stream = None
+    if child_key == "topics" and TOPIC_STREAMING and has_channel():
+        stream = TopicStream(parent["uuid"])
+
+    res = await call_llm(
+        chain,
+        {variable: parent, "goal": goal},
+        node=LEVEL_NODES[child_key],
+        priority=priority,
+        max_output_tokens=max_output_tokens,
+        cache=cache,
+        on_partial=stream.on_partial if stream else None,
+        on_reset=stream.reset if stream else None,
+    )
+    children = res.dict()[child_key]
+    if stream:
+        stream.assign_uuids(children)
+    emit_items(child_key, parent["uuid"], children, progress.complete(child_key))
+    return children
+
+
+async def generate_children_batch(chain, parent_key, parents, goal, progress, cache=True):
+    # 부모 여러 개의 자식을 한 번에 생성, 결과를 얻은 부모만 "부모 UUID → 자식 목록" 으로 반환
+    child_key = CHILD_LEVELS[parent_key][0]
+    priority, max_output_tokens = level_budget(child_key)
+    listing = json.dumps(
+        [
+            {"index": index, **strip_uuids(parent)}
+            for index, parent in enumerate(parents, 1)
+        ],
+        ensure_ascii=False,
+    )
+
+    results = {}
+    try:
+        res = await call_llm(
+            chain,
+            {"parents": listing, "goal": goal},
+            node=f"{LEVEL_NODES[child_key]}Batch",
+            priority=priority,
+            max_output_tokens=max_output_tokens * len(parents),
+            cache=cache,
+        )
+        for entry in res.dict()["results"]:
+            index = entry["parent_index"]
+            if 1 <= index <= len(parents) and entry[child_key]:
+                results.setdefault(parents[index - 1]["uuid"], entry[child_key])
+    except Exception as e:
+        logger.warning(f"Batch generation failed for {len(parents)} {parent_key}: {e}")
+
+    for parent in parents:
+        if parent["uuid"] in results:
+            emit_items(
+                child_key,
+                parent["uuid"],
+                results[parent["uuid"]],
+                progress.complete(child_key),
+            )
+    return results
+
+
+async def generate_group(chains, parent_key, parents, goal, progress, cache=True):
+    # 형제 항목 묶음의 자식 생성, 묶음 호출에서 결과가 빠진 항목만 하나씩 다시 요청
+    logger.info(f"진행 중: {parent_key} - {[p.get('title') for p in parents]}")
+    results = {}
+    if len(parents) > 1:
+        results = await generate_children_batch(
+            chains.batch(parent_key), parent_key, parents, goal, progress, cache
+        )
+
+    missing = [parent for parent in parents if parent["uuid"] not in results]
+    children = await asyncio.gather(
+        *(
+            generate_children(
+                chains.single(parent_key), parent_key, parent, goal, progress, cache
+            )
+            for parent in missing
+        )
+    )
+    for parent, items in zip(missing, children):
+        results[parent["uuid"]] = items
+    logger.info(f"완료됨: {parent_key} - {[p.get('title') for p in parents]}")
+    return results
+
+
+# 결과를 항목 단위 이벤트로 전송하는 노드 (노드 전체 결과는 다시 보내지 않음)
+HIERARCHY_NODES = {"Hierarchy", *LEVEL_NODES.values(), "Summary"}
+
+
+def count_items(state):
+    # 생성된 계층별 항목 수
+    counts = {}
+    for child_key in LEVEL_NODES:
+        if state.get(child_key) and child_key != state.get("category"):
+            counts[child_key] = len(flatten_items(state[child_key]))
+    return counts
+
+
+def flatten_items(items_by_parent):
+    items = []
+    for sub in items_by_parent.values():
+        items.extend(sub)
+    return items
+
+
+async def handle_level(state, parent_key):
+    child_key = CHILD_LEVELS[parent_key][0]
+    parents = flatten_items(state[parent_key])
+    # 앞 노드가 미리 생성한 개요로 이 계층까지 채웠으면 그대로 사용
+    if state.get(child_key) and all(p["uuid"] in state[child_key] for p in parents):
+        return {child_key: state[child_key]}
+    outline = await take_outline(state)
+    if outline and all(p["uuid"] in outline.get(child_key, {}) for p in parents):
+        logger.info(f"미리 생성한 개요 사용: {list(outline)}")
+        return outline
+
+    chains = LevelChains()
+    progress = Progress()
+    progress.add(child_key, len(parents))
+
+    # 동시 실행 수와 요청 한도는 전역 스케줄러가 관리
+    group_results = await asyncio.gather(
+        *(
+            generate_group(chains, parent_key, group, state.get("goal"), progress)
+            for group in split_groups(parent_key, parents)
+        )
+    )
+    logger.info("모든 작업 완료")
 
     result = {}
-    for lesson, res in zip(lessons, task_results):
-        topics = res.dict()["topics"]
-        result[lesson["uuid"]] = topics
+    for group_result in group_results:
+        result.update(group_result)
+    # 부모 순서대로 정렬
+    return {child_key: {parent["uuid"]: result[parent["uuid"]] for parent in parents}}
+
+
+async def handle_curriculum(state):
+    return await handle_level(state, "programs")
+
+
+async def handle_subject(state):
+    return await handle_level(state, "curriculums")
+
+
+async def handle_module(state):
+    return await handle_level(state, "subjects")
+
+
+async def handle_lesson(state):
+    return await handle_level(state, "modules")
 
-    state["topics"] = result
-    logger.info(result)
-    return {"topics": result}
+
+async def handle_topic(state):
+    result = await handle_level(state, "lessons")
+    logger.info(result["topics"])
+    return result
+
+
+async def generate_hierarchy(goal, category, roots, cache=True, last_level=None):
+    # 계층별 barrier 없이, 각 항목이 끝나는 즉시 그 자식 항목의 생성을 시작합니다.
+    # 결과는 계층별로 "부모 UUID → 자식 목록" 형태로 모읍니다.
+    # cache=False 면 LLM 응답 캐시를 읽지 않고 새로 생성합니다.
+    # last_level 을 주면 그 계층까지만 생성합니다.
+    # 묶음 모드에서는 한 부모의 자식들(형제)을 묶어서 다음 계층을 요청합니다.
+    chains = LevelChains()
+    results = {}
+    level = category
+    while level in CHILD_LEVELS and level != last_level:
+        level = CHILD_LEVELS[level][0]
+        results[level] = {}
+
+    progress = Progress()
+
+    async def expand(level, parents):
+        if level not in CHILD_LEVELS or level == last_level or not parents:
+            return
+        child_key = CHILD_LEVELS[level][0]
+
+        async def run(group):
+            produced = await generate_group(
+                chains, level, group, goal, progress, cache=cache
+            )
+            for parent in group:
+                children = produced[parent["uuid"]]
+                results[child_key][parent["uuid"]] = children
+                if child_key in CHILD_LEVELS and child_key != last_level:
+                    progress.add(CHILD_LEVELS[child_key][0], len(children))
+            await asyncio.gather(
+                *(expand(child_key, produced[parent["uuid"]]) for parent in group)
+            )
+
+        await asyncio.gather(*(run(group) for group in split_groups(level, parents)))
+
+    if category in CHILD_LEVELS:
+        progress.add(CHILD_LEVELS[category][0], len(roots))
+    await expand(category, roots)
+    logger.info("모든 작업 완료")
+    return results
+
+
+def attach_children(results, level, parent_uuid):
+    # generate_hierarchy 결과를 부모 → 자식 트리로 조립
+    child_key = CHILD_LEVELS[level][0]
+    children = results[child_key].get(parent_uuid, [])
+    if child_key in CHILD_LEVELS:
+        for child in children:
+            child[CHILD_LEVELS[child_key][0]] = attach_children(
+                results, child_key, child["uuid"]
+            )
+    return children
+
+
+async def regenerate_subtree(goal, level, node):
+    # 저장된 노드 하나를 부모로 삼아 그 아래 계층만 다시 생성 (그래프 전체를 다시 실행하지 않음)
+    results = await generate_hierarchy(goal, level, [node], cache=False)
+    return CHILD_LEVELS[level][0], attach_children(results, level, node["uuid"])
+
+
+# 스타일 선택을 기다리는 동안 개요(주제 본문을 뺀 계층)를 미리 생성할지 여부
+# 개요 생성 프롬프트는 goal 과 부모 항목만 사용하므로 선택한 스타일과 관계없이 같은 결과가 나옵니다.
+SPECULATIVE_OUTLINE = os.getenv("SPECULATIVE_OUTLINE", "1") == "1"
+OUTLINE_LAST_LEVEL = "lessons"
+
+
+def outline_key(state):
+    # 미리 생성한 개요가 기반한 분류 결과
+    return (state.get("goal"), state.get("category"), (state.get("info") or {}).get("uuid"))
+
+
+def start_outline_speculation(thread_id, state):
+    category = state.get("category")
+    if (
+        not SPECULATIVE_OUTLINE
+        or category not in CHILD_LEVELS
+        or category == OUTLINE_LAST_LEVEL
+        or not state.get(category)
+    ):
+        return False
+    roots = flatten_items(state[category])
+    return speculations.start(
+        thread_id,
+        outline_key(state),
+        lambda: generate_hierarchy(
+            state.get("goal"), category, roots, last_level=OUTLINE_LAST_LEVEL
+        ),
+    )
+
+
+async def take_outline(state):
+    # 미리 생성한 개요 (없으면 None), 그동안 모아 둔 항목 이벤트는 이때 전송
+    return await speculations.take(current_session.get(), outline_key(state))
+
+
+async def handle_hierarchy(state):
+    category = state["category"]
+    goal = state.get("goal")
+    results = await take_outline(state)
+    if results is None:
+        return await generate_hierarchy(goal, category, flatten_items(state[category]))
+
+    # 미리 생성한 마지막 계층부터 이어서 생성
+    last_level = list(results)[-1]
+    logger.info(f"미리 생성한 개요 사용: {list(results)}")
+    if last_level in CHILD_LEVELS:
+        results.update(
+            await generate_hierarchy(goal, last_level, flatten_items(results[last_level]))
+        )
+    return results
 
 
 def determine_next_node(state):
@@ -855,12 +1329,12 @@ def check_classify_result(state):
         return "continue"
 
 
-def select_node(state):
+async def select_node(state):
     print(state)
     return state
 
 
-def summary_result(state):
+async def summary_result(state):
     logger.info("Summary result")
 
     def update_relations(state, parent_key, child_key):
@@ -902,7 +1376,7 @@ def summary_result(state):
     return state
 
 
-def build_graph():
+def build_graph(checkpointer=None):
     graph = StateGraph(State)
 
     # -------------------------
@@ -927,11 +1401,14 @@ def build_graph():
     # -------------------------
     # 4. 커리큘럼 관련 노드
     # -------------------------
-    graph.add_node("Curriculum", handle_curriculum)
-    graph.add_node("Subject", handle_subject)
-    graph.add_node("Module", handle_module)
-    graph.add_node("Lesson", handle_lesson)
-    graph.add_node("Topic", handle_topic)
+    if HIERARCHY_MODE == "dataflow":
+        graph.add_node("Hierarchy", handle_hierarchy)
+    else:
+        graph.add_node("Curriculum", handle_curriculum)
+        graph.add_node("Subject", handle_subject)
+        graph.add_node("Module", handle_module)
+        graph.add_node("Lesson", handle_lesson)
+        graph.add_node("Topic", handle_topic)
 
     graph.add_node("SelectNode", select_node)
     graph.add_node("Summary", summary_result)
@@ -961,27 +1438,35 @@ def build_graph():
     graph.add_edge(["CollectData", "Classify"], "SelectNode")
 
     # 4. 커리큘럼 경로 설정
-    graph.add_conditional_edges(
-        "SelectNode",
-        determine_next_node,
-        {
-            "Curriculum": "Curriculum",
-            "Subject": "Subject",
-            "Module": "Module",
-            "Lesson": "Lesson",
-            "Topic": "Topic",
-        },
-    )
+    if HIERARCHY_MODE == "dataflow":
+        # 모든 하위 계층을 하나의 노드에서 dataflow 방식으로 생성
+        graph.add_edge("SelectNode", "Hierarchy")
+        graph.add_edge("Hierarchy", "Summary")
+    else:
+        graph.add_conditional_edges(
+            "SelectNode",
+            determine_next_node,
+            {
+                "Curriculum": "Curriculum",
+                "Subject": "Subject",
+                "Module": "Module",
+                "Lesson": "Lesson",
+                "Topic": "Topic",
+            },
+        )
+
+        graph.add_edge("Curriculum", "Subject")
+        graph.add_edge("Subject", "Module")
+        graph.add_edge("Module", "Lesson")
+        graph.add_edge("Lesson", "Topic")
+        graph.add_edge("Topic", "Summary")
 
-    graph.add_edge("Curriculum", "Subject")
-    graph.add_edge("Subject", "Module")
-    graph.add_edge("Module", "Lesson")
-    graph.add_edge("Lesson", "Topic")
-    graph.add_edge("Topic", "Summary")
     graph.add_edge("Summary", END)
 
     # -------------------------
     # 메모리 설정
     # -------------------------
-    memory = MemorySaver()
-    return graph.compile(checkpointer=memory, interrupt_after=["SelectNode"])
+    # 스타일 선택 대기 중인 세션 상태를 보관 (기본값은 프로세스 메모리)
+    if checkpointer is None:
+        checkpointer = MemorySaver()
+    return graph.compile(checkpointer=checkpointer, interrupt_after=["SelectNode"])
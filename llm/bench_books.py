@@ -0,0 +1,58 @@
+import sys
+import json
+import time
+import argparse
+
+from typing import Any, Dict
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from book_cache import encode_json, orjson
+
+
+# main.BookModel 과 같은 모델 (main 을 import 하면 그래프와 DB 연결까지 만들어짐)
+class BookModel(BaseModel):
+    title: str
+    description: str
+    content: Dict[str, Any]
+
+
+def validated(book):
+    # response_model=BookModel 일 때 FastAPI 가 하는 일: 모델 검증 후 jsonable_encoder, json 직렬화
+    model = BookModel.model_validate(book)
+    return json.dumps(jsonable_encoder(model), ensure_ascii=False).encode("utf-8")
+
+
+def trusted(book):
+    return encode_json(book)
+
+
+def measure(func, book, repeat):
+    func(book)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(book)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="책 응답 직렬화 벤치마크")
+    parser.add_argument("path", nargs="?", default="data2.json")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with open(args.path, "r", encoding="utf-8") as f:
+        book = {"title": "백엔드 개발", "description": "벤치마크", "content": json.load(f)}
+
+    size = len(trusted(book))
+    print(f"{args.path}: {size / 1024:.1f} KiB, encoder={'orjson' if orjson else 'json'}")
+    validated_ms = measure(validated, book, args.repeat)
+    trusted_ms = measure(trusted, book, args.repeat)
+    print(f"validated (response_model): {validated_ms:8.2f} ms")
+    print(f"trusted   (encode_json)   : {trusted_ms:8.2f} ms")
+    print(f"speedup                   : {validated_ms / trusted_ms:8.1f}x")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
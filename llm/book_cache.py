@@ -0,0 +1,176 @@
+import os
+import json
+import gzip
+import asyncio
+import hashlib
+import threading
+
+from datetime import datetime
+from collections import OrderedDict
+
+from bson import ObjectId
+
+try:
+    import brotli
+except ImportError:  # brotli 가 없으면 gzip 만 사용
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # orjson 이 없으면 표준 json 사용
+    orjson = None
+
+
+def json_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_json(value):
+    # 저장된 문서를 모델 검증 없이 바로 JSON 바이트로 직렬화
+    if orjson is not None:
+        return orjson.dumps(value, default=json_default)
+    return json.dumps(value, ensure_ascii=False, default=json_default).encode("utf-8")
+
+
+def make_etag(version, content_hash):
+    return f'"{version}-{content_hash[:16]}"'
+
+
+def body_etag(body):
+    # 저장된 버전이 없는 응답(목록 등)은 직렬화된 본문으로 ETag 를 만듦
+    return f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding):
+    # Accept-Encoding 에서 q=0 이 아닌 인코딩 중 br > gzip 순으로 선택
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if params in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+# 이보다 큰 본문은 이벤트 루프를 막지 않도록 스레드에서 압축
+COMPRESS_THREAD_MIN_BYTES = int(os.getenv("COMPRESS_THREAD_MIN_BYTES", str(64 * 1024)))
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+async def acompress(body, encoding):
+    if encoding is not None and len(body) > COMPRESS_THREAD_MIN_BYTES:
+        return await asyncio.to_thread(compress, body, encoding)
+    return compress(body, encoding)
+
+
+class BookResponseCache:
+    """(책 id, ETag) 별로 직렬화된 본문과 압축본을 보관하는 바이트 기준 LRU.
+
+    ETag 에 버전과 내용 해시가 들어 있으므로 책이 바뀌면 키가 달라진다.
+    같은 책의 새 본문을 넣을 때 예전 ETag 의 항목은 지운다.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, book_id, etag, encoding):
+        with self._lock:
+            variants = self._items.get((book_id, etag))
+            if variants is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end((book_id, etag))
+            self.hits += 1
+            body = variants.get(encoding)
+            if body is not None or encoding is None:
+                return body
+            identity = variants[None]
+
+        # 아직 없는 압축본은 처음 요청될 때 만들어 둠
+        body = await acompress(identity, encoding)
+        self._add_variant(book_id, etag, encoding, body)
+        return body
+
+    async def put(self, book_id, etag, body, encoding=None):
+        with self._lock:
+            self._remove(book_id)
+            self._items[(book_id, etag)] = {None: body}
+            self._bytes += len(body)
+            self._evict()
+        if encoding is None:
+            return body
+        compressed = await acompress(body, encoding)
+        self._add_variant(book_id, etag, encoding, compressed)
+        return compressed
+
+    def invalidate(self, book_id):
+        with self._lock:
+            self._remove(book_id)
+
+    def _add_variant(self, book_id, etag, encoding, body):
+        with self._lock:
+            variants = self._items.get((book_id, etag))
+            if variants is None or encoding in variants:
+                return
+            variants[encoding] = body
+            self._bytes += len(body)
+            self._evict()
+
+    def _remove(self, book_id):
+        for key in [key for key in self._items if key[0] == book_id]:
+            self._bytes -= sum(len(v) for v in self._items.pop(key).values())
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._items:
+            _, variants = self._items.popitem(last=False)
+            self._bytes -= sum(len(v) for v in variants.values())
+
+    def stats(self):
+        return {
+            "items": len(self._items),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "brotli": brotli is not None,
+        }
+
+
+book_cache = BookResponseCache(
+    int(os.getenv("BOOK_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+)
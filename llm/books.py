@@ -0,0 +1,594 @@
+import os
+import re
+import json
+import asyncio
+import hashlib
+import logging
+import uuid
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING, InsertOne, ReplaceOne, ReturnDocument
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger("Books")
+
+# 책 본문을 읽을 때 사용하는 기본 projection
+BOOK_PROJECTION = {"title": 1, "description": 1, "content": 1}
+
+# 저장된 책은 서버가 직접 쓴 데이터이므로 읽을 때 Pydantic 모델로 다시 검증하지 않음
+# (0 으로 설정하면 응답 전에 BookModel 로 검증)
+TRUSTED_READS = os.getenv("TRUSTED_BOOK_READS", "1") == "1"
+
+# ETag 를 만들 때 읽는 필드 (본문은 읽지 않음)
+VERSION_PROJECTION = {"version": 1, "content_hash": 1}
+
+# 목록 조회에서 선택할 수 있는 필드와 기본 필드 (content 는 명시적으로 요청할 때만)
+LIST_FIELDS = (
+    "index",
+    "title",
+    "description",
+    "stats",
+    "outline",
+    "content",
+    "created_at",
+    "updated_at",
+)
+DEFAULT_LIST_FIELDS = ("index", "title", "description", "stats")
+
+# 개수를 세는 교육 프로그램 계층
+COUNTED_LEVELS = ("programs", "curriculums", "subjects", "modules", "lessons", "topics")
+
+# 저장할 때 계산하는 파생 데이터(통계, 목차, 노드 인덱스)의 버전
+# 계산 방식이 바뀌면 올려서 기존 책도 다시 계산되게 함
+DERIVED_VERSION = 3
+
+# 노드 인덱스에 넣을 때 한 번에 쓰는 문서 수
+NODE_BATCH_SIZE = 500
+
+
+def content_stats(content):
+    # 계층별 항목 수와 직렬화된 본문 크기 (책을 저장할 때 한 번 계산)
+    counts = {level: 0 for level in COUNTED_LEVELS}
+    stack = [content]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if isinstance(value, list):
+                    if key in counts:
+                        counts[key] += len(value)
+                    stack.extend(value)
+                elif isinstance(value, dict):
+                    stack.append(value)
+        elif isinstance(node, list):
+            stack.extend(node)
+    counts["size"] = len(json.dumps(content, ensure_ascii=False).encode("utf-8"))
+    return counts
+
+
+def iter_nodes(content, path="", parent_uuid=None):
+    # uuid 가 있는 모든 노드를 (노드, 계층, 경로, 부모 uuid, 순서) 로 순회
+    # 경로는 content 안에서의 위치 ("subjects.0.modules.2" 형식)
+    # path/parent_uuid 를 주면 그 위치에 있는 노드의 하위 노드만 순회
+    stack = [(content, path, parent_uuid)]
+    while stack:
+        node, path, parent_uuid = stack.pop()
+        for key, value in node.items():
+            if key not in COUNTED_LEVELS or not isinstance(value, list):
+                continue
+            for order, child in enumerate(value):
+                if not isinstance(child, dict):
+                    continue
+                child_path = f"{path}.{key}.{order}" if path else f"{key}.{order}"
+                if "uuid" in child:
+                    yield child, key, child_path, parent_uuid, order
+                stack.append((child, child_path, child.get("uuid", parent_uuid)))
+
+
+def dedupe_uuids(content, seen=None):
+    # 책 안에서 이미 나온 uuid 를 가진 노드에 새 uuid 를 발급하고 바꾼 노드 수를 반환
+    # (content 는 형식이 자유로운 dict 라서 LLM 이나 가져오기 파일이 같은 uuid 를 쓸 수 있음)
+    # uuid 가 문자열이 아니면 경로로 찾을 수 없으므로 함께 새로 발급
+    seen = set() if seen is None else seen
+    reminted = 0
+    for node, *_ in iter_nodes(content):
+        if not isinstance(node["uuid"], str) or node["uuid"] in seen:
+            node["uuid"] = str(uuid.uuid4())
+            reminted += 1
+        seen.add(node["uuid"])
+    return reminted
+
+
+def split_node(node):
+    # 노드를 자기 필드와 하위 계층으로 분리
+    fields = {}
+    children = []
+    for key, value in node.items():
+        if key in COUNTED_LEVELS and isinstance(value, list):
+            children.extend(
+                child["uuid"]
+                for child in value
+                if isinstance(child, dict) and "uuid" in child
+            )
+        else:
+            fields[key] = value
+    return fields, children
+
+
+def resolve_path(content, path):
+    # "subjects.0.modules.2" 형식의 경로에 있는 노드
+    node = content
+    for part in path.split("."):
+        node = node[int(part)] if isinstance(node, list) else node[part]
+    return node
+
+
+def node_documents(book_id, content, path="", parent_uuid=None):
+    # book_nodes 에 저장할 노드 문서
+    for node, level, path, parent_uuid, order in iter_nodes(
+        content, path, parent_uuid
+    ):
+        fields, children = split_node(node)
+        yield {
+            "book_id": book_id,
+            "uuid": node["uuid"],
+            "level": level,
+            "path": path,
+            "parent_uuid": parent_uuid,
+            "order": order,
+            "node": fields,
+            "children": children,
+        }
+
+
+def build_outline(node):
+    # 제목과 uuid 만 남긴 목차 트리 (토픽은 제목 대신 name 필드를 사용)
+    outline = []
+    for key, value in node.items():
+        if key not in COUNTED_LEVELS or not isinstance(value, list):
+            continue
+        for child in value:
+            if not isinstance(child, dict):
+                continue
+            entry = {
+                "uuid": child.get("uuid"),
+                "title": child.get("title") or child.get("name", ""),
+                "level": key,
+            }
+            children = build_outline(child)
+            if children:
+                entry["children"] = children
+            outline.append(entry)
+    return outline
+
+
+def book_hash(book):
+    # 책의 제목, 설명, 본문으로 만든 내용 해시 (키 순서와 무관)
+    data = json.dumps(
+        {
+            "title": book.get("title", ""),
+            "description": book.get("description", ""),
+            "content": book.get("content", {}),
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def build_book_document(owner, index, book, now):
+    # 저장할 책 문서 (목록 조회용 통계와 목차 포함)
+    # book_nodes 의 (book_id, uuid) 가 유일하도록 중복 uuid 는 저장 전에 새로 발급
+    content = book.get("content", {})
+    dedupe_uuids(content)
+    return {
+        "owner": owner,
+        "index": index,
+        "title": book.get("title", ""),
+        "description": book.get("description", ""),
+        "content": content,
+        "stats": content_stats(content),
+        "outline": build_outline(content),
+        "version": 1,
+        "content_hash": book_hash(book),
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class BookStore:
+    """사용자별 책을 한 문서당 한 권씩 저장하는 저장소.
+
+    예전에는 사용자 문서의 `data` 배열에 모든 책을 넣었으므로, 한 권을 읽을 때도
+    서재 전체를 읽어야 했다. 지금은 `user_books` 컬렉션에 (owner, index) 로 저장한다.
+    `index` 는 사용자별로 증가하는 순번이며 목록 정렬 기준으로 사용한다.
+
+    책의 각 노드는 `book_nodes` 컬렉션에 (book_id, uuid) 로 따로 저장해서
+    레슨이나 토픽 하나를 읽을 때 책 전체를 읽지 않도록 한다.
+    """
+
+    def __init__(self, db, search=None):
+        self.users = db["books"]  # 기존 사용자 문서 컬렉션
+        self.books = db["user_books"]
+        self.nodes = db["book_nodes"]
+        self.search = search  # 노드 검색 색인 (없으면 색인하지 않음)
+        self._indexes_ready = False
+        self._migrated = set()
+        self._backfilled = set()
+
+    async def ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        await self.books.create_index(
+            [("owner", ASCENDING), ("index", ASCENDING)], unique=True
+        )
+        await self.nodes.create_index(
+            [("book_id", ASCENDING), ("uuid", ASCENDING)], unique=True
+        )
+        self._indexes_ready = True
+
+    async def _prepare(self, owner):
+        await self.ensure_indexes()
+        await self.migrate_user(owner)
+        await self.backfill_derived(owner)
+
+    async def backfill_derived(self, owner):
+        # 파생 데이터가 없거나 오래된 책을 다시 계산 (사용자별로 한 번만 확인)
+        if owner in self._backfilled:
+            return
+        cursor = self.books.find(
+            {"owner": owner, "derived": {"$ne": DERIVED_VERSION}}, BOOK_PROJECTION
+        )
+        async for book in cursor:
+            content = book.get("content", {})
+            fields = {
+                "stats": content_stats(content),
+                "outline": build_outline(content),
+            }
+            if dedupe_uuids(content):
+                # 예전에 중복 uuid 로 저장된 책은 본문의 uuid 를 고쳐서 저장
+                fields["content"] = content
+                logger.warning(f"Reminted duplicate node uuids in book {book['_id']}")
+            fields["content_hash"] = book_hash(book)
+            try:
+                await self.books.update_one(
+                    {"_id": book["_id"]}, {"$set": fields, "$max": {"version": 1}}
+                )
+                await self.index_nodes(owner, book["_id"], content)
+            except Exception as e:
+                # 책 한 권 때문에 사용자의 다른 책을 못 읽게 되지 않도록 건너뜀
+                # (derived 가 기록되지 않으므로 다음 실행에서 다시 시도)
+                logger.error(f"Error backfilling book {book['_id']}: {e}")
+        self._backfilled.add(owner)
+
+    async def index_nodes(self, owner, book_id, content):
+        # 책의 노드를 uuid 로 찾을 수 있도록 book_nodes 와 검색 색인에 다시 씀
+        nodes = list(node_documents(book_id, content))
+        await self.nodes.delete_many({"book_id": book_id})
+        await self._write_nodes(nodes)
+        await self._index_search(owner, book_id, nodes)
+        await self.books.update_one(
+            {"_id": book_id}, {"$set": {"derived": DERIVED_VERSION}}
+        )
+
+    async def _index_search(self, owner, book_id, nodes):
+        if self.search is not None:
+            await self.search.index_book(owner, book_id, nodes)
+
+    async def rebuild_search(self):
+        # 검색 색인을 book_nodes 로 다시 만듦 (색인 파일이 없어졌을 때)
+        if self.search is None:
+            return 0
+        total = 0
+        async for book in self.books.find({}, {"owner": 1}):
+            nodes = await self.nodes.find(
+                {"book_id": book["_id"]}, {"uuid": 1, "level": 1, "node": 1}
+            ).to_list(None)
+            total += await self.search.index_book(book["owner"], book["_id"], nodes)
+        logger.info(f"Rebuilt search index with {total} nodes")
+        return total
+
+    async def _write_nodes(self, documents):
+        # 한 배치가 실패해도 나머지 배치는 모두 쓰고, 실패한 쓰기를 모아 BulkWriteError 로 올림
+        errors = []
+
+        async def flush(batch):
+            try:
+                await self.nodes.bulk_write(
+                    [InsertOne(document) for document in batch], ordered=False
+                )
+            except BulkWriteError as e:
+                # index 는 배치 안에서의 위치이므로 실패한 문서를 op 로 함께 기록
+                errors.extend(
+                    {**error, "op": batch[error["index"]]}
+                    for error in e.details.get("writeErrors", [])
+                )
+
+        batch = []
+        for document in documents:
+            batch.append(document)
+            if len(batch) >= NODE_BATCH_SIZE:
+                await flush(batch)
+                batch = []
+        if batch:
+            await flush(batch)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    async def migrate_user(self, owner):
+        # 사용자 문서의 data 배열에 남아 있는 책을 user_books 로 옮김 (여러 번 실행해도 안전)
+        if owner in self._migrated:
+            return 0
+        user = await self.users.find_one(
+            {"_id": owner, "data": {"$exists": True}}, {"data": 1}
+        )
+        migrated = 0
+        if user is not None:
+            data = user["data"]
+            if not isinstance(data, list):
+                data = [data]
+            now = datetime.now(timezone.utc)
+            requests = [
+                ReplaceOne(
+                    {"owner": owner, "index": index},
+                    build_book_document(owner, index, book, now),
+                    upsert=True,
+                )
+                for index, book in enumerate(data)
+                if isinstance(book, dict)
+            ]
+            if requests:
+                await self.books.bulk_write(requests, ordered=False)
+            await self.users.update_one(
+                {"_id": owner},
+                {"$unset": {"data": ""}, "$max": {"book_count": len(data)}},
+            )
+            migrated = len(requests)
+            logger.info(f"Migrated {migrated} embedded books for user {owner}")
+        self._migrated.add(owner)
+        return migrated
+
+    async def migrate_all(self):
+        await self.ensure_indexes()
+        total = 0
+        async for user in self.users.find({"data": {"$exists": True}}, {"_id": 1}):
+            total += await self.migrate_user(user["_id"])
+        return total
+
+    async def user_exists(self, owner):
+        return await self.users.find_one({"_id": owner}, {"_id": 1}) is not None
+
+    async def _next_index(self, owner, count=1):
+        # count 개의 연속된 순번을 예약하고 첫 번째 순번을 반환
+        user = await self.users.find_one_and_update(
+            {"_id": owner},
+            {"$inc": {"book_count": count}},
+            projection={"book_count": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        return user["book_count"] - count
+
+    async def create(self, owner, book):
+        await self._prepare(owner)
+        now = datetime.now(timezone.utc)
+        doc = build_book_document(owner, await self._next_index(owner), book, now)
+        result = await self.books.insert_one(doc)
+        doc["_id"] = result.inserted_id
+        try:
+            await self.index_nodes(owner, doc["_id"], doc["content"])
+        except Exception:
+            # 노드를 색인하지 못한 책은 남기지 않음
+            await self.delete(doc["_id"])
+            raise
+        doc["derived"] = DERIVED_VERSION
+        return doc
+
+    async def create_many(self, owner, books):
+        """여러 권을 unordered bulk insert 로 저장.
+
+        저장한 책의 _id 목록(입력 순서)과 실패한 책의 (위치, 오류) 목록을 반환한다.
+        """
+        await self._prepare(owner)
+        now = datetime.now(timezone.utc)
+        first = await self._next_index(owner, len(books))
+        docs = [
+            build_book_document(owner, first + position, book, now)
+            for position, book in enumerate(books)
+        ]
+
+        errors = []
+        try:
+            await self.books.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            errors = [
+                (error["index"], error.get("errmsg", "write error"))
+                for error in e.details.get("writeErrors", [])
+            ]
+
+        # insert_many 가 각 문서에 _id 를 채워 넣음
+        failed = {position for position, _ in errors}
+        inserted = [doc for position, doc in enumerate(docs) if position not in failed]
+        node_lists = [
+            (doc["_id"], list(node_documents(doc["_id"], doc["content"])))
+            for doc in inserted
+        ]
+        try:
+            await self._write_nodes(node for _, nodes in node_lists for node in nodes)
+        except BulkWriteError as e:
+            # 노드를 쓰지 못한 책은 지우고 그 책만 실패로 보고
+            bad = {}
+            for error in e.details.get("writeErrors", []):
+                bad.setdefault(error["op"]["book_id"], error.get("errmsg", "write error"))
+            await self.books.delete_many({"_id": {"$in": list(bad)}})
+            await self.nodes.delete_many({"book_id": {"$in": list(bad)}})
+            positions = {doc["_id"]: position for position, doc in enumerate(docs)}
+            errors.extend(
+                (positions[book_id], f"Error indexing nodes: {message}")
+                for book_id, message in bad.items()
+            )
+            inserted = [doc for doc in inserted if doc["_id"] not in bad]
+            node_lists = [
+                (book_id, nodes) for book_id, nodes in node_lists if book_id not in bad
+            ]
+        for book_id, nodes in node_lists:
+            await self._index_search(owner, book_id, nodes)
+        if inserted:
+            await self.books.update_many(
+                {"_id": {"$in": [doc["_id"] for doc in inserted]}},
+                {"$set": {"derived": DERIVED_VERSION}},
+            )
+        return [doc["_id"] for doc in inserted], sorted(errors)
+
+    async def list(self, owner, projection=BOOK_PROJECTION):
+        await self._prepare(owner)
+        cursor = self.books.find({"owner": owner}, projection).sort("index", ASCENDING)
+        return await cursor.to_list(None)
+
+    async def list_page(self, owner, fields=DEFAULT_LIST_FIELDS, after=None, limit=50):
+        # index 기준 keyset 페이지네이션, 선택한 필드만 projection 으로 읽음
+        await self._prepare(owner)
+        query = {"owner": owner}
+        if after is not None:
+            query["index"] = {"$gt": after}
+        projection = {field: 1 for field in fields}
+        projection["index"] = 1
+        cursor = (
+            self.books.find(query, projection).sort("index", ASCENDING).limit(limit + 1)
+        )
+        books = await cursor.to_list(limit + 1)
+
+        next_cursor = None
+        if len(books) > limit:
+            books = books[:limit]
+            next_cursor = books[-1]["index"]
+        return books, next_cursor
+
+    async def iter_books(self, owner, projection=BOOK_PROJECTION, batch_size=8):
+        # 책을 순서대로 몇 권씩만 가져오면서 한 권씩 반환 (서재 전체를 메모리에 올리지 않음)
+        await self._prepare(owner)
+        cursor = (
+            self.books.find({"owner": owner}, projection)
+            .sort("index", ASCENDING)
+            .batch_size(batch_size)
+        )
+        async for book in cursor:
+            yield book
+
+    def _book_filter(self, owner, book_id):
+        if ObjectId.is_valid(book_id):
+            return {"owner": owner, "_id": ObjectId(book_id)}
+        return None
+
+    async def find(self, owner, book_id, projection=BOOK_PROJECTION):
+        # book_id 는 책의 ObjectId 또는 목록에서의 위치(0부터 시작하는 번호)
+        await self._prepare(owner)
+        book_filter = self._book_filter(owner, book_id)
+        if book_filter is not None:
+            return await self.books.find_one(book_filter, projection)
+
+        position = int(book_id)
+        if position < 0:
+            return None
+        # (owner, index) 인덱스만 건너뛰므로 앞쪽 책의 본문은 읽지 않음
+        cursor = (
+            self.books.find({"owner": owner}, projection)
+            .sort("index", ASCENDING)
+            .skip(position)
+            .limit(1)
+        )
+        books = await cursor.to_list(1)
+        return books[0] if books else None
+
+    async def get(self, book_id, projection=BOOK_PROJECTION):
+        return await self.books.find_one({"_id": book_id}, projection)
+
+    async def node(self, book_id, uuid, children=False):
+        # 노드 하나의 필드와 하위 노드 uuid 목록, children=True 면 바로 아래 노드까지 포함
+        node = await self.nodes.find_one(
+            {"book_id": book_id, "uuid": uuid}, {"_id": 0, "book_id": 0}
+        )
+        if node is None or not children:
+            return node
+        cursor = self.nodes.find(
+            {"book_id": book_id, "uuid": {"$in": node["children"]}},
+            {"_id": 0, "book_id": 0},
+        ).sort("order", ASCENDING)
+        node["children"] = await cursor.to_list(None)
+        return node
+
+    async def replace_children(self, book_id, node_uuid, child_key, children, version):
+        """노드 하나의 하위 계층을 통째로 바꾸고 새 버전을 반환.
+
+        책이 version 이후에 바뀌었거나 노드가 없어졌으면 None 을 반환한다.
+        book_nodes 는 바뀐 하위 트리만 다시 쓴다.
+        """
+        node = await self.nodes.find_one(
+            {"book_id": book_id, "uuid": node_uuid}, {"path": 1}
+        )
+        book = await self.books.find_one(
+            {"_id": book_id, "version": version}, {**BOOK_PROJECTION, "owner": 1}
+        )
+        if node is None or book is None:
+            return None
+
+        path = node["path"]
+        content = book["content"]
+        # 새 하위 노드의 uuid 가 책의 다른 노드와 겹치지 않도록 함
+        taken = {
+            other["uuid"]
+            for other, _, other_path, _, _ in iter_nodes(content)
+            if not other_path.startswith(f"{path}.")
+        }
+        dedupe_uuids({child_key: children}, taken)
+        resolve_path(content, path)[child_key] = children
+        result = await self.books.update_one(
+            {"_id": book_id, "version": version},
+            {
+                "$set": {
+                    f"content.{path}.{child_key}": children,
+                    "stats": content_stats(content),
+                    "outline": build_outline(content),
+                    "content_hash": book_hash(book),
+                    "updated_at": datetime.now(timezone.utc),
+                },
+                "$inc": {"version": 1},
+            },
+        )
+        if result.modified_count == 0:
+            return None
+
+        # 예전 하위 노드를 지우고 새 하위 노드만 색인
+        await self.nodes.delete_many(
+            {"book_id": book_id, "path": {"$regex": f"^{re.escape(path)}\\."}}
+        )
+        subtree = {child_key: children}
+        await self._write_nodes(node_documents(book_id, subtree, path, node_uuid))
+        await self.nodes.update_one(
+            {"_id": node["_id"]},
+            {"$set": {"children": [child["uuid"] for child in children]}},
+        )
+        await self._index_search(
+            book["owner"], book_id, node_documents(book_id, content)
+        )
+        return version + 1
+
+    async def delete(self, book_id):
+        result = await self.books.delete_one({"_id": ObjectId(book_id)})
+        await self.nodes.delete_many({"book_id": ObjectId(book_id)})
+        if self.search is not None:
+            await self.search.remove_book(book_id)
+        return result.deleted_count
+
+
+if __name__ == "__main__":
+    # 기존 사용자 문서의 data 배열을 user_books 컬렉션으로 옮기는 마이그레이션
+    from database import db
+
+    async def main():
+        total = await BookStore(db).migrate_all()
+        logger.info(f"Migrated {total} books")
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
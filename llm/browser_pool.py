@@ -0,0 +1,220 @@
+import os
+import time
+import asyncio
+import logging
+
+try:
+    from playwright.async_api import async_playwright
+    from playwright.async_api import TimeoutError as PageTimeoutError
+except ImportError:  # playwright 가 없으면 브라우저 풀을 사용할 수 없음
+    async_playwright = None
+    PageTimeoutError = asyncio.TimeoutError
+
+logger = logging.getLogger("BrowserPool")
+
+# 동시에 열 수 있는 페이지 수, 페이지 하나의 제한 시간(초)
+BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "4"))
+BROWSER_PAGE_TIMEOUT = float(os.getenv("BROWSER_PAGE_TIMEOUT", "15"))
+# 메모리 누수를 막기 위해 이 페이지 수나 시간(초)이 지나면 브라우저를 새로 띄움
+BROWSER_RECYCLE_PAGES = int(os.getenv("BROWSER_RECYCLE_PAGES", "200"))
+BROWSER_RECYCLE_SECONDS = float(os.getenv("BROWSER_RECYCLE_SECONDS", str(30 * 60)))
+
+# 본문 추출에 필요 없는 리소스는 받지 않음
+BLOCKED_RESOURCES = {"image", "media", "font", "stylesheet"}
+
+
+class BrowserPool:
+    """여러 세션이 함께 쓰는 headless Chromium 하나와 페이지 수 제한.
+
+    요청마다 브라우저를 띄우는 대신 브라우저 하나를 계속 띄워 두고, 페이지마다
+    새 context 를 열고 닫는다. 페이지가 모두 사용 중이면 빈 자리가 날 때까지 기다린다.
+    교체할 브라우저는 새 브라우저를 띄운 뒤, 사용 중인 페이지가 모두 끝나면 닫는다.
+    """
+
+    def __init__(
+        self,
+        max_pages=BROWSER_MAX_PAGES,
+        page_timeout=BROWSER_PAGE_TIMEOUT,
+        recycle_pages=BROWSER_RECYCLE_PAGES,
+        recycle_seconds=BROWSER_RECYCLE_SECONDS,
+    ):
+        self.max_pages = max_pages
+        self.page_timeout = page_timeout
+        self.recycle_pages = recycle_pages
+        self.recycle_seconds = recycle_seconds
+        self._slots = asyncio.Semaphore(max_pages)
+        self._lock = asyncio.Lock()
+        self._playwright = None
+        self._browser = None
+        self._launched_at = 0.0
+        self._served = 0
+        # 브라우저별 사용 중인 페이지 수, 교체되어 닫을 브라우저
+        self._in_use = {}
+        self._retired = set()
+        self.waiting = 0
+        self.in_flight = 0
+        self.pages = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.launches = 0
+        self.recycles = 0
+        self.wait_seconds = 0.0
+
+    @property
+    def available(self):
+        return async_playwright is not None
+
+    async def start(self):
+        # 서버 시작 시 브라우저를 미리 띄워 첫 요청의 시작 지연을 없앰
+        async with self._lock:
+            await self._current_browser()
+
+    async def _launch(self):
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        browser = await self._playwright.chromium.launch(headless=True)
+        self._launched_at = time.monotonic()
+        self._served = 0
+        self.launches += 1
+        logger.info("Launched headless Chromium")
+        return browser
+
+    def _should_recycle(self):
+        return (
+            self._served >= self.recycle_pages
+            or time.monotonic() - self._launched_at >= self.recycle_seconds
+        )
+
+    async def _current_browser(self):
+        # self._lock 안에서 호출
+        if self._browser is not None and not self._browser.is_connected():
+            self._in_use.pop(self._browser, None)
+            self._browser = None
+        elif self._browser is not None and self._should_recycle():
+            old = self._browser
+            self._browser = None
+            self.recycles += 1
+            if self._in_use.get(old):
+                self._retired.add(old)
+            else:
+                self._in_use.pop(old, None)
+                await self._close_browser(old)
+        if self._browser is None:
+            self._browser = await self._launch()
+            self._in_use[self._browser] = 0
+        return self._browser
+
+    async def _acquire(self):
+        async with self._lock:
+            browser = await self._current_browser()
+            self._in_use[browser] += 1
+            self._served += 1
+            return browser
+
+    async def _release(self, browser):
+        async with self._lock:
+            if browser not in self._in_use:
+                # 사용 중에 연결이 끊겨 이미 정리된 브라우저
+                return
+            self._in_use[browser] -= 1
+            if browser in self._retired and not self._in_use[browser]:
+                self._retired.discard(browser)
+                del self._in_use[browser]
+                await self._close_browser(browser)
+
+    async def _close_browser(self, browser):
+        try:
+            await browser.close()
+        except Exception as e:
+            logger.warning(f"Error closing browser: {e}")
+
+    async def _block_resources(self, route):
+        if route.request.resource_type in BLOCKED_RESOURCES:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _render(self, browser, url):
+        context = await browser.new_context()
+        try:
+            await context.route("**/*", self._block_resources)
+            page = await context.new_page()
+            await page.goto(url, timeout=self.page_timeout * 1000)
+            return await page.content()
+        finally:
+            await context.close()
+
+    async def fetch(self, url):
+        """페이지를 렌더링한 HTML (실패하거나 제한 시간을 넘기면 None)."""
+        queued_at = time.monotonic()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.wait_seconds += time.monotonic() - queued_at
+
+        self.in_flight += 1
+        try:
+            browser = await self._acquire()
+            try:
+                # goto 의 제한 시간과 별개로 context 생성과 content 읽기까지 포함한 제한
+                html = await asyncio.wait_for(
+                    self._render(browser, url), self.page_timeout * 2
+                )
+                self.pages += 1
+                return html
+            finally:
+                await self._release(browser)
+        except (asyncio.TimeoutError, PageTimeoutError):
+            self.timeouts += 1
+            logger.warning(f"Timed out rendering {url}")
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Error rendering {url}: {e}")
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+        return None
+
+    async def fetch_many(self, urls):
+        # 성공한 페이지만 (url, html) 로 입력 순서대로 반환
+        pages = await asyncio.gather(*(self.fetch(url) for url in urls))
+        return [(url, html) for url, html in zip(urls, pages) if html is not None]
+
+    async def close(self):
+        async with self._lock:
+            for browser in list(self._in_use):
+                await self._close_browser(browser)
+            self._in_use.clear()
+            self._retired.clear()
+            self._browser = None
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+
+    def stats(self):
+        return {
+            "available": self.available,
+            "running": self._browser is not None,
+            "max_pages": self.max_pages,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "pages": self.pages,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "launches": self.launches,
+            "recycles": self.recycles,
+            "retiring": len(self._retired),
+            "browser_age_seconds": (
+                round(time.monotonic() - self._launched_at, 1) if self._browser else None
+            ),
+            "avg_wait_seconds": (
+                round(self.wait_seconds / (self.pages + self.failures + self.timeouts), 3)
+                if self.pages + self.failures + self.timeouts
+                else 0.0
+            ),
+        }
+
+
+browser_pool = BrowserPool()
@@ -0,0 +1,349 @@
+import os
+import time
+import zlib
+import sqlite3
+import asyncio
+import logging
+import threading
+
+from datetime import datetime, timezone, timedelta
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+logger = logging.getLogger("Checkpoint")
+
+# 마지막 활동 이후 이 시간이 지나면 세션 상태를 삭제 (초)
+CHECKPOINT_TTL = int(os.getenv("CHECKPOINT_TTL", str(60 * 60)))
+
+
+class MongoCheckpointStore:
+    # 스레드(세션)마다 최신 체크포인트 하나만 보관하는 MongoDB 저장소
+    def __init__(self, collection, ttl):
+        self.collection = collection
+        self.ttl = ttl
+        self._indexes_ready = False
+
+    async def _ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        await self.collection.create_index("updated_at", expireAfterSeconds=self.ttl)
+        self._indexes_ready = True
+
+    async def load(self, thread_id, ns):
+        doc = await self.collection.find_one({"_id": f"{thread_id}:{ns}"})
+        if doc is None:
+            return None
+        updated_at = doc["updated_at"].replace(tzinfo=timezone.utc)
+        # TTL 인덱스는 주기적으로만 삭제하므로 만료 여부를 직접 확인
+        if updated_at + timedelta(seconds=self.ttl) < datetime.now(timezone.utc):
+            return None
+        doc["writes"] = list(doc.get("writes", {}).values())
+        return doc
+
+    async def save(self, thread_id, ns, record):
+        await self._ensure_indexes()
+        record = dict(record, writes={}, updated_at=datetime.now(timezone.utc))
+        await self.collection.replace_one(
+            {"_id": f"{thread_id}:{ns}"},
+            dict(record, thread_id=thread_id, ns=ns),
+            upsert=True,
+        )
+
+    async def add_writes(self, thread_id, ns, checkpoint_id, writes):
+        await self.collection.update_one(
+            {"_id": f"{thread_id}:{ns}", "checkpoint_id": checkpoint_id},
+            {
+                "$set": dict(
+                    {f"writes.{w['task_id']}:{w['idx']}": w for w in writes},
+                    updated_at=datetime.now(timezone.utc),
+                )
+            },
+        )
+
+    async def delete(self, thread_id):
+        await self.collection.delete_many({"thread_id": thread_id})
+
+
+class SQLiteCheckpointStore:
+    # 로컬 실행용 SQLite 저장소 (만료된 세션은 저장할 때마다 정리)
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                parent_id TEXT,
+                checkpoint_type TEXT NOT NULL,
+                checkpoint BLOB NOT NULL,
+                metadata_type TEXT NOT NULL,
+                metadata BLOB NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (thread_id, ns)
+            );
+            CREATE INDEX IF NOT EXISTS checkpoints_updated_at ON checkpoints (updated_at);
+            CREATE TABLE IF NOT EXISTS checkpoint_writes (
+                thread_id TEXT NOT NULL,
+                ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                type TEXT NOT NULL,
+                value BLOB NOT NULL,
+                PRIMARY KEY (thread_id, ns, checkpoint_id, task_id, idx)
+            );
+            """
+        )
+        self._conn.commit()
+
+    def _load(self, thread_id, ns):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT checkpoint_id, parent_id, checkpoint_type, checkpoint, "
+                "metadata_type, metadata, updated_at FROM checkpoints "
+                "WHERE thread_id = ? AND ns = ?",
+                (thread_id, ns),
+            ).fetchone()
+            if row is None or row[6] + self.ttl < time.time():
+                return None
+            writes = self._conn.execute(
+                "SELECT task_id, idx, channel, type, value FROM checkpoint_writes "
+                "WHERE thread_id = ? AND ns = ? AND checkpoint_id = ? "
+                "ORDER BY task_id, idx",
+                (thread_id, ns, row[0]),
+            ).fetchall()
+        return {
+            "checkpoint_id": row[0],
+            "parent_id": row[1],
+            "checkpoint_type": row[2],
+            "checkpoint": row[3],
+            "metadata_type": row[4],
+            "metadata": row[5],
+            "writes": [
+                {"task_id": w[0], "idx": w[1], "channel": w[2], "type": w[3], "value": w[4]}
+                for w in writes
+            ],
+        }
+
+    def _save(self, thread_id, ns, record):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    ns,
+                    record["checkpoint_id"],
+                    record["parent_id"],
+                    record["checkpoint_type"],
+                    record["checkpoint"],
+                    record["metadata_type"],
+                    record["metadata"],
+                    now,
+                ),
+            )
+            # 최신 체크포인트의 쓰기 기록만 유지
+            self._conn.execute(
+                "DELETE FROM checkpoint_writes "
+                "WHERE thread_id = ? AND ns = ? AND checkpoint_id != ?",
+                (thread_id, ns, record["checkpoint_id"]),
+            )
+            expired = [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT DISTINCT thread_id FROM checkpoints WHERE updated_at < ?",
+                    (now - self.ttl,),
+                )
+            ]
+            for expired_id in expired:
+                self._delete(expired_id)
+            self._conn.commit()
+
+    def _add_writes(self, thread_id, ns, checkpoint_id, writes):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO checkpoint_writes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        thread_id,
+                        ns,
+                        checkpoint_id,
+                        w["task_id"],
+                        w["idx"],
+                        w["channel"],
+                        w["type"],
+                        w["value"],
+                    )
+                    for w in writes
+                ],
+            )
+            self._conn.execute(
+                "UPDATE checkpoints SET updated_at = ? WHERE thread_id = ? AND ns = ?",
+                (time.time(), thread_id, ns),
+            )
+            self._conn.commit()
+
+    def _delete(self, thread_id):
+        self._conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+        self._conn.execute(
+            "DELETE FROM checkpoint_writes WHERE thread_id = ?", (thread_id,)
+        )
+
+    def _delete_thread(self, thread_id):
+        with self._lock:
+            self._delete(thread_id)
+            self._conn.commit()
+
+    async def load(self, thread_id, ns):
+        return await asyncio.to_thread(self._load, thread_id, ns)
+
+    async def save(self, thread_id, ns, record):
+        await asyncio.to_thread(self._save, thread_id, ns, record)
+
+    async def add_writes(self, thread_id, ns, checkpoint_id, writes):
+        await asyncio.to_thread(self._add_writes, thread_id, ns, checkpoint_id, writes)
+
+    async def delete(self, thread_id):
+        await asyncio.to_thread(self._delete_thread, thread_id)
+
+
+class TTLCheckpointSaver(BaseCheckpointSaver):
+    """세션마다 최신 체크포인트만 압축해 보관하고, 오래 방치된 세션은 만료시키는 체크포인터.
+
+    그래프는 astream/aupdate_state 로만 실행하므로 비동기 메서드만 구현한다.
+    동기 메서드는 BaseCheckpointSaver 의 기본 구현(NotImplementedError)을 그대로 사용한다.
+    """
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
+    def _dumps(self, value):
+        type_, data = self.serde.dumps_typed(value)
+        return type_, zlib.compress(data)
+
+    def _loads(self, type_, data):
+        return self.serde.loads_typed((type_, zlib.decompress(bytes(data))))
+
+    @staticmethod
+    def _config(thread_id, ns, checkpoint_id):
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": ns,
+                "checkpoint_id": checkpoint_id,
+            }
+        }
+
+    async def aget_tuple(self, config):
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        ns = configurable.get("checkpoint_ns", "")
+        record = await self.store.load(thread_id, ns)
+        if record is None:
+            return None
+
+        # 최신 체크포인트만 보관하므로 과거 체크포인트 요청에는 응답하지 않음
+        checkpoint_id = configurable.get("checkpoint_id")
+        if checkpoint_id and checkpoint_id != record["checkpoint_id"]:
+            return None
+
+        parent_config = None
+        if record["parent_id"]:
+            parent_config = self._config(thread_id, ns, record["parent_id"])
+
+        return CheckpointTuple(
+            config=self._config(thread_id, ns, record["checkpoint_id"]),
+            checkpoint=self._loads(record["checkpoint_type"], record["checkpoint"]),
+            metadata=self._loads(record["metadata_type"], record["metadata"]),
+            parent_config=parent_config,
+            pending_writes=[
+                (w["task_id"], w["channel"], self._loads(w["type"], w["value"]))
+                for w in record["writes"]
+            ],
+        )
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        if config is None:
+            return
+        checkpoint_tuple = await self.aget_tuple(config)
+        if checkpoint_tuple is None or limit == 0:
+            return
+        if before is not None:
+            before_id = before["configurable"].get("checkpoint_id")
+            if before_id and checkpoint_tuple.checkpoint["id"] >= before_id:
+                return
+        if filter and any(
+            checkpoint_tuple.metadata.get(k) != v for k, v in filter.items()
+        ):
+            return
+        yield checkpoint_tuple
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        ns = configurable.get("checkpoint_ns", "")
+
+        checkpoint_type, checkpoint_data = self._dumps(checkpoint)
+        metadata_type, metadata_data = self._dumps(metadata)
+        await self.store.save(
+            thread_id,
+            ns,
+            {
+                "checkpoint_id": checkpoint["id"],
+                "parent_id": configurable.get("checkpoint_id"),
+                "checkpoint_type": checkpoint_type,
+                "checkpoint": checkpoint_data,
+                "metadata_type": metadata_type,
+                "metadata": metadata_data,
+            },
+        )
+        return self._config(thread_id, ns, checkpoint["id"])
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        configurable = config["configurable"]
+        records = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self._dumps(value)
+            records.append(
+                {
+                    "task_id": task_id,
+                    "idx": WRITES_IDX_MAP.get(channel, idx),
+                    "channel": channel,
+                    "type": type_,
+                    "value": data,
+                }
+            )
+        await self.store.add_writes(
+            configurable["thread_id"],
+            configurable.get("checkpoint_ns", ""),
+            configurable["checkpoint_id"],
+            records,
+        )
+
+    async def adelete_thread(self, thread_id):
+        await self.store.delete(thread_id)
+
+
+def create_checkpointer(db):
+    # CHECKPOINT_BACKEND: "mongo" (기본), "sqlite" (로컬 실행), "memory"
+    backend = os.getenv("CHECKPOINT_BACKEND", "mongo")
+    if backend == "mongo":
+        store = MongoCheckpointStore(db["checkpoints"], CHECKPOINT_TTL)
+    elif backend == "sqlite":
+        path = os.getenv("CHECKPOINT_PATH", "checkpoints.sqlite3")
+        store = SQLiteCheckpointStore(path, CHECKPOINT_TTL)
+    else:
+        return MemorySaver()
+    logger.info(f"Checkpoint backend: {backend}, TTL {CHECKPOINT_TTL}s")
+    return TTLCheckpointSaver(store)
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+
+from contextvars import ContextVar
+
+logger = logging.getLogger("Events")
+
+
+class EventChannel:
+    # 그래프 노드에서 만든 메시지를 WebSocket 으로 순서대로 전달하는 채널
+    # 여러 작업이 동시에 send 하지 않도록 전송은 pump 하나에서만 수행
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.queue = asyncio.Queue()
+        self.closed = False
+        self._pump = None
+
+    def start(self):
+        self._pump = asyncio.create_task(self.pump())
+
+    def emit(self, message):
+        if not self.closed:
+            self.queue.put_nowait(message)
+
+    async def pump(self):
+        while True:
+            message = await self.queue.get()
+            if message is None:
+                return
+            try:
+                if isinstance(message, str):
+                    await self.websocket.send_text(message)
+                else:
+                    await self.websocket.send_json(message)
+            except Exception as e:
+                # 연결이 끊겼다면 남은 메시지는 버림
+                logger.warning(f"Error sending event: {e}")
+                self.closed = True
+                return
+
+    async def aclose(self):
+        # 대기 중인 메시지를 모두 보낸 뒤 종료
+        self.queue.put_nowait(None)
+        if self._pump is not None:
+            await self._pump
+        self.closed = True
+
+
+# 현재 세션의 이벤트 채널 (WebSocket 연결마다 설정)
+current_channel = ContextVar("current_channel", default=None)
+
+
+def emit(message):
+    channel = current_channel.get()
+    if channel is not None:
+        channel.emit(message)
+
+
+def has_channel():
+    channel = current_channel.get()
+    return channel is not None and not channel.closed
@@ -0,0 +1,64 @@
+from books import COUNTED_LEVELS
+from book_cache import encode_json
+
+# 한 번에 내보내는 Markdown 조각의 크기
+CHUNK_BYTES = 64 * 1024
+
+
+async def iter_ndjson(books):
+    # 한 줄에 책 한 권 (POST /api/books/import 로 다시 가져올 수 있는 형식)
+    async for book in books:
+        yield encode_json(
+            {
+                "id": str(book["_id"]),
+                "title": book.get("title", ""),
+                "description": book.get("description", ""),
+                "content": book.get("content", {}),
+            }
+        ) + b"\n"
+
+
+def render_markdown(book):
+    """책 한 권을 Markdown 조각으로 변환.
+
+    책 제목은 `#`, 그 아래 계층(프로그램 ... 모듈, 레슨, 토픽)은 깊이에 따라 `##` 부터 `######` 까지
+    제목으로 쓰고, 설명과 토픽 본문은 문단으로 쓴다.
+    """
+    yield f"# {book.get('title', '')}\n\n"
+    if book.get("description"):
+        yield f"{book['description']}\n\n"
+
+    stack = [(book.get("content", {}), 1)]
+    while stack:
+        node, depth = stack.pop()
+        if depth > 1:
+            # 토픽은 제목 대신 name 필드를 사용
+            title = node.get("title") or node.get("name", "")
+            yield f"{'#' * min(depth, 6)} {title}\n\n"
+            for field in ("description", "content"):
+                if isinstance(node.get(field), str) and node[field]:
+                    yield f"{node[field]}\n\n"
+        children = []
+        for key, value in node.items():
+            if key in COUNTED_LEVELS and isinstance(value, list):
+                children.extend(child for child in value if isinstance(child, dict))
+        stack.extend((child, depth + 1) for child in reversed(children))
+
+
+async def iter_markdown(books):
+    # 작은 조각을 모아 CHUNK_BYTES 정도씩 전송
+    buffer = []
+    size = 0
+    async for book in books:
+        for part in render_markdown(book):
+            data = part.encode("utf-8")
+            buffer.append(data)
+            size += len(data)
+            if size >= CHUNK_BYTES:
+                yield b"".join(buffer)
+                buffer = []
+                size = 0
+        buffer.append(b"---\n\n")
+        size += 5
+    if buffer:
+        yield b"".join(buffer)
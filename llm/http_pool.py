@@ -0,0 +1,85 @@
+import os
+import logging
+
+import httpx
+
+logger = logging.getLogger("HttpPool")
+
+# 서버 전체가 함께 쓰는 HTTP 연결 수와 기본 제한 시간(초)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+)
+
+
+class HttpPool:
+    """keep-alive 연결을 재사용하는 httpx.AsyncClient 하나.
+
+    처음 사용할 때 만들고 서버 종료 시 닫는다.
+    """
+
+    def __init__(
+        self,
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive=HTTP_MAX_KEEPALIVE,
+        timeout=HTTP_TIMEOUT,
+        transport=None,
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.timeout = timeout
+        # 테스트에서 httpx.MockTransport 등으로 바꿀 수 있는 전송 계층
+        self.transport = transport
+        self._client = None
+        self.clients_created = 0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                ),
+                timeout=self.timeout,
+                follow_redirects=True,
+                headers={"User-Agent": USER_AGENT},
+                transport=self.transport,
+            )
+            self.clients_created += 1
+        return self._client
+
+    async def get(self, url, **kwargs):
+        self.requests += 1
+        try:
+            return await self.client.get(url, **kwargs)
+        except httpx.HTTPError:
+            self.errors += 1
+            raise
+
+    def stream(self, method, url, **kwargs):
+        self.requests += 1
+        return self.client.stream(method, url, **kwargs)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self):
+        return {
+            "open": self._client is not None and not self._client.is_closed,
+            "clients_created": self.clients_created,
+            "max_connections": self.max_connections,
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+http_pool = HttpPool()
@@ -0,0 +1,62 @@
+import threading
+
+from collections import defaultdict, deque
+
+# 노드별로 보관하는 최근 응답 시간 수와, 백분위를 계산하기 위한 최소 표본 수
+WINDOW = 200
+MIN_SAMPLES = 20
+
+COUNTERS = ("hedges", "hedge_wins", "timeouts")
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = int(round(p / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+class LatencyTracker:
+    """노드별 LLM 호출 시간(스케줄러 슬롯을 받은 뒤부터)의 최근 기록과 헤지 통계."""
+
+    def __init__(self, window=WINDOW, min_samples=MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._counters = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+        self._lock = threading.Lock()
+
+    def record(self, node, seconds):
+        with self._lock:
+            self._samples[node].append(seconds)
+
+    def count(self, node, counter):
+        with self._lock:
+            self._counters[node][counter] += 1
+
+    def percentile(self, node, p):
+        # 표본이 충분하지 않으면 None
+        with self._lock:
+            samples = sorted(self._samples.get(node, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return percentile(samples, p)
+
+    def stats(self):
+        with self._lock:
+            nodes = {node: sorted(samples) for node, samples in self._samples.items()}
+            counters = {node: dict(c) for node, c in self._counters.items()}
+        result = {}
+        for node in nodes.keys() | counters.keys():
+            samples = nodes.get(node, [])
+            result[node] = {
+                "count": len(samples),
+                **{
+                    f"p{p}": round(percentile(samples, p), 3) if samples else None
+                    for p in (50, 95, 99)
+                },
+                **counters.get(node, dict.fromkeys(COUNTERS, 0)),
+            }
+        return result
+
+
+latency_tracker = LatencyTracker()
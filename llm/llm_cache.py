@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+
+from collections import OrderedDict, defaultdict
+
+logger = logging.getLogger("LLMCache")
+
+
+def strip_uuids(value):
+    # 생성할 때마다 바뀌는 uuid 는 캐시 키와 저장 값에서 제외
+    if isinstance(value, dict):
+        return {k: strip_uuids(v) for k, v in value.items() if k != "uuid"}
+    if isinstance(value, list):
+        return [strip_uuids(v) for v in value]
+    return value
+
+
+def make_key(model_name, prompt_text, schema_json):
+    digest = hashlib.sha256()
+    for part in (model_name, prompt_text, schema_json):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class MemoryTier:
+    # 항목 수 기준 LRU
+    def __init__(self, max_items, ttl):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = (time.time() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class SQLiteTier:
+    # 로컬 SQLite 파일에 저장, TTL 과 전체 크기 기준으로 오래 안 쓴 항목부터 삭제
+    def __init__(self, path, ttl, max_bytes):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                node TEXT,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if created + self.ttl < now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+        return json.loads(value)
+
+    def put(self, key, node, value):
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, node, data, size, now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE created < ?", (now - self.ttl,)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()
+        while total > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM llm_cache ORDER BY accessed ASC LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def stats(self):
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+        return {"items": count, "bytes": total}
+
+
+class LLMCache:
+    """모델명 + 렌더링된 프롬프트 + 출력 스키마로 키를 만드는 2단계 응답 캐시."""
+
+    def __init__(self, enabled, disabled_nodes, memory, persistent):
+        self.enabled = enabled
+        self.disabled_nodes = disabled_nodes
+        self.memory = memory
+        self.persistent = persistent
+        self.counters = defaultdict(
+            lambda: {"memory_hits": 0, "persistent_hits": 0, "misses": 0}
+        )
+
+    def is_enabled(self, node):
+        return self.enabled and node not in self.disabled_nodes
+
+    async def get(self, key, node):
+        value = self.memory.get(key)
+        if value is not None:
+            self.counters[node]["memory_hits"] += 1
+            return value
+
+        if self.persistent is not None:
+            try:
+                value = await asyncio.to_thread(self.persistent.get, key)
+            except Exception as e:
+                logger.error(f"Error reading LLM cache: {e}")
+                value = None
+            if value is not None:
+                self.memory.put(key, value)
+                self.counters[node]["persistent_hits"] += 1
+                return value
+
+        self.counters[node]["misses"] += 1
+        return None
+
+    async def put(self, key, node, value):
+        self.memory.put(key, value)
+        if self.persistent is not None:
+            try:
+                await asyncio.to_thread(self.persistent.put, key, node, value)
+            except Exception as e:
+                logger.error(f"Error writing LLM cache: {e}")
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "disabled_nodes": sorted(self.disabled_nodes),
+            "memory_items": len(self.memory),
+            "persistent": self.persistent.stats() if self.persistent else None,
+            "nodes": {node: dict(c) for node, c in self.counters.items()},
+        }
+
+
+def create_cache():
+    ttl = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 60 * 60)))
+    disabled_nodes = {
+        node.strip()
+        for node in os.getenv("LLM_CACHE_DISABLED_NODES", "").split(",")
+        if node.strip()
+    }
+    memory = MemoryTier(int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "512")), ttl)
+
+    persistent = None
+    path = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+    if path:
+        try:
+            persistent = SQLiteTier(
+                path, ttl, int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+            )
+        except Exception as e:
+            logger.error(f"Error opening LLM cache at {path}: {e}")
+
+    return LLMCache(
+        enabled=os.getenv("LLM_CACHE_ENABLED", "1") == "1",
+        disabled_nodes=disabled_nodes,
+        memory=memory,
+        persistent=persistent,
+    )
+
+
+llm_cache = create_cache()
@@ -0,0 +1,29 @@
+class LineTooLong(Exception):
+    pass
+
+
+async def iter_lines(chunks, max_line_bytes):
+    """바이트 청크 스트림을 줄 단위로 나눠 (줄 번호, 줄) 을 반환.
+
+    max_line_bytes 보다 긴 줄은 버퍼에 쌓지 않고 건너뛰며 줄 대신 LineTooLong 을 반환한다.
+    """
+    buffer = b""
+    line_no = 0
+    skipping = False
+    async for chunk in chunks:
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        for line in lines:
+            line_no += 1
+            if skipping or len(line) > max_line_bytes:
+                skipping = False
+                yield line_no, LineTooLong()
+            else:
+                yield line_no, line
+        if len(buffer) > max_line_bytes:
+            # 줄 끝이 나올 때까지 나머지는 버림
+            skipping = True
+            buffer = b""
+    if skipping:
+        yield line_no + 1, LineTooLong()
+    elif buffer.strip():
+        yield line_no + 1, buffer
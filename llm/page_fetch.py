@@ -0,0 +1,143 @@
+import os
+import time
+import asyncio
+import logging
+
+from collections import Counter, deque
+
+import httpx
+
+from http_pool import http_pool
+from browser_pool import browser_pool
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # selectolax 가 없으면 BeautifulSoup 으로 파싱
+    LexborHTMLParser = None
+    from bs4 import BeautifulSoup, SoupStrainer
+
+logger = logging.getLogger("PageFetch")
+
+# 정적 HTML 에서 뽑은 본문이 이보다 짧으면 브라우저로 다시 렌더링
+STATIC_MIN_CHARS = int(os.getenv("STATIC_FETCH_MIN_CHARS", "200"))
+# 정적 요청으로 받을 최대 본문 크기
+STATIC_MAX_BYTES = int(os.getenv("STATIC_FETCH_MAX_BYTES", str(2 * 1024 * 1024)))
+
+# 본문으로 사용하는 태그 (예전 BeautifulSoupTransformer 의 tags_to_extract 와 같음)
+TEXT_TAGS = ("span",)
+
+# /api/metrics 에 보여 줄 최근 URL 기록 수
+RECENT_FETCHES = 50
+
+
+def extract_text(html, tags=TEXT_TAGS):
+    # 지정한 태그의 텍스트를 공백으로 이어 붙임
+    if LexborHTMLParser is not None:
+        tree = LexborHTMLParser(html)
+        texts = (node.text(separator=" ") for node in tree.css(",".join(tags)))
+    else:
+        soup = BeautifulSoup(html, "html.parser", parse_only=SoupStrainer(list(tags)))
+        texts = (node.get_text(" ") for node in soup.find_all(list(tags)))
+    return " ".join(" ".join(text.split()) for text in texts if text.strip())
+
+
+class PageFetcher:
+    """블로그 글 본문을 가져오는 두 단계 경로.
+
+    먼저 공용 HTTP 클라이언트로 HTML 을 받아 바로 파싱하고, 본문이 비었거나
+    STATIC_MIN_CHARS 보다 짧을 때만 브라우저 풀로 렌더링한다.
+    URL 마다 어느 경로로 가져왔는지 기록한다.
+    """
+
+    def __init__(self, min_chars=STATIC_MIN_CHARS, max_bytes=STATIC_MAX_BYTES):
+        self.min_chars = min_chars
+        self.max_bytes = max_bytes
+        self.paths = Counter()
+        self.seconds = Counter()
+        self.recent = deque(maxlen=RECENT_FETCHES)
+
+    async def _download(self, url):
+        async with http_pool.stream("GET", url) as response:
+            if response.status_code != 200:
+                return None
+            if "html" not in response.headers.get("content-type", "html"):
+                return None
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) > self.max_bytes:
+                    break
+            return bytes(body[: self.max_bytes]).decode(
+                response.charset_encoding or "utf-8", errors="replace"
+            )
+
+    async def fetch_static(self, url):
+        try:
+            html = await self._download(url)
+        except httpx.HTTPError as e:
+            http_pool.errors += 1
+            logger.info(f"Static fetch failed for {url}: {e}")
+            return None
+        if not html:
+            return None
+        # HTML 파싱은 CPU 작업이므로 이벤트 루프 밖에서 실행
+        return await asyncio.to_thread(extract_text, html)
+
+    async def fetch_browser(self, url):
+        html = await browser_pool.fetch(url)
+        if html is None:
+            return None
+        return await asyncio.to_thread(extract_text, html)
+
+    def _record(self, url, path, started, text):
+        elapsed = time.monotonic() - started
+        self.paths[path] += 1
+        self.seconds[path] += elapsed
+        self.recent.append(
+            {
+                "url": url,
+                "path": path,
+                "ms": round(elapsed * 1000),
+                "chars": len(text or ""),
+            }
+        )
+        logger.info(f"Fetched {url} via {path} in {elapsed * 1000:.0f} ms")
+
+    async def fetch(self, url):
+        """본문 텍스트 (가져오지 못하면 None)."""
+        started = time.monotonic()
+        text = await self.fetch_static(url)
+        if text and len(text) >= self.min_chars:
+            self._record(url, "static", started, text)
+            return text
+
+        rendered = await self.fetch_browser(url)
+        if rendered and len(rendered) >= len(text or ""):
+            self._record(url, "browser", started, rendered)
+            return rendered
+        if text:
+            # 브라우저로도 더 나은 결과가 없으면 짧더라도 정적 결과를 사용
+            self._record(url, "static_short", started, text)
+            return text
+        self._record(url, "failed", started, None)
+        return None
+
+    async def fetch_many(self, urls):
+        # 본문을 얻은 페이지만 (url, 텍스트) 로 입력 순서대로 반환
+        texts = await asyncio.gather(*(self.fetch(url) for url in urls))
+        return [(url, text) for url, text in zip(urls, texts) if text]
+
+    def stats(self):
+        return {
+            "paths": dict(self.paths),
+            "avg_ms": {
+                path: round(self.seconds[path] / count * 1000)
+                for path, count in self.paths.items()
+            },
+            "min_chars": self.min_chars,
+            "parser": "selectolax" if LexborHTMLParser is not None else "bs4",
+            "recent": list(self.recent),
+        }
+
+
+page_fetcher = PageFetcher()
@@ -0,0 +1,270 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+import threading
+
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger("Scheduler")
+
+# 우선순위 클래스 (숫자가 작을수록 먼저 처리)
+INTERACTIVE = 0  # 스타일 선택 단계처럼 사용자가 기다리는 호출
+NORMAL = 1  # 블로그 분석, 커리큘럼 ~ 레슨 생성
+BULK = 2  # 주제(topic) 대량 생성
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", NORMAL: "normal", BULK: "bulk"}
+
+# 현재 요청을 보낸 세션 (WebSocket 연결마다 설정)
+current_session = ContextVar("current_session", default="default")
+
+
+# AIMD 동시 실행 창: 성공하면 창 크기만큼 성공할 때마다 1 씩 늘리고, 과부하 신호를 받으면 절반으로 줄임
+AIMD_DECREASE = 0.5
+# 동시에 실패한 요청들 때문에 연달아 줄어들지 않도록, 한 번 줄인 뒤 이 시간 동안은 다시 줄이지 않음
+AIMD_COOLDOWN = 2.0
+
+# 재시도 대기: 지터를 준 지수 백오프 (base * 2^attempt 이내에서 무작위, 최대 cap)
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+
+
+def backoff_delay(attempt, retry_after=None):
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+    if retry_after:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def estimate_tokens(text):
+    # 한글/영문이 섞인 프롬프트 기준의 대략적인 토큰 수
+    return len(text) // 2 + 1
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        self.refill(now)
+        # 버킷 용량보다 큰 요청은 가득 찼을 때 통과시킨다
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+
+class _Waiter:
+    __slots__ = ("loop", "future", "priority", "session", "tokens", "tag", "enqueued")
+
+    def __init__(self, priority, session, tokens, tag):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.priority = priority
+        self.session = session
+        self.tokens = tokens
+        self.tag = tag
+        self.enqueued = time.monotonic()
+
+
+class LLMScheduler:
+    """프로세스 전역 LLM 호출 스케줄러.
+
+    요청 수(RPM)와 예상 토큰 수(TPM) 두 개의 토큰 버킷, 동시 실행 수 제한,
+    우선순위 클래스, 세션 간 공정 분배(가상 시간 기반 공정 큐잉)를 적용한다.
+
+    동시 실행 수는 [min_concurrency, max_concurrency] 범위의 AIMD 창으로 조절한다.
+    호출 결과를 on_success / on_overload 로 알려주면 창이 늘거나 줄고,
+    Retry-After 가 있으면 그 시간 동안 새 요청을 내보내지 않는다.
+    """
+
+    def __init__(
+        self, rpm, tpm, max_concurrency, min_concurrency=1, initial_concurrency=None
+    ):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.window = float(initial_concurrency or max_concurrency)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._paused_until = 0.0
+        self.overloads = 0
+
+        self._lock = threading.Lock()
+        self._waiters = []  # (priority, tag, seq, waiter) 힙
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._session_tags = {}
+        self._timer_deadline = None
+
+        self.granted = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.wait_seconds = {name: 0.0 for name in PRIORITY_NAMES.values()}
+
+    @asynccontextmanager
+    async def slot(self, priority=NORMAL, tokens=1, session=None):
+        session = session or current_session.get()
+        with self._lock:
+            # 세션별로 가상 시간을 누적해, 많이 요청한 세션이 뒤로 밀리도록 한다
+            start = max(self._virtual_time, self._session_tags.get(session, 0.0))
+            tag = start + tokens
+            self._session_tags[session] = tag
+            waiter = _Waiter(priority, session, tokens, tag)
+            heapq.heappush(self._waiters, (priority, tag, next(self._seq), waiter))
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            # 허가를 받은 직후 취소되었다면 슬롯을 반납한다
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release()
+            else:
+                waiter.future.cancel()
+                self._dispatch()
+            raise
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        grants = []
+        timer = None
+        with self._lock:
+            while self._waiters:
+                _, tag, _, waiter = self._waiters[0]
+                if waiter.future.done():
+                    heapq.heappop(self._waiters)
+                    continue
+                if self.in_flight >= self.limit:
+                    break
+
+                now = time.monotonic()
+                delay = max(
+                    self._paused_until - now,
+                    self.requests.wait_time(1, now),
+                    self.tokens.wait_time(waiter.tokens, now),
+                )
+                if delay > 0:
+                    deadline = now + delay
+                    # 타이머를 걸어 둔 이벤트 루프가 먼저 종료되었을 수 있으므로
+                    # 지난 기한은 무시하고 다시 건다
+                    if (
+                        self._timer_deadline is None
+                        or self._timer_deadline < now
+                        or deadline < self._timer_deadline
+                    ):
+                        self._timer_deadline = deadline
+                        timer = (waiter.loop, delay)
+                    break
+
+                heapq.heappop(self._waiters)
+                self.requests.consume(1)
+                self.tokens.consume(waiter.tokens)
+                self.in_flight += 1
+                self._virtual_time = max(self._virtual_time, tag - waiter.tokens)
+
+                name = PRIORITY_NAMES[waiter.priority]
+                self.granted[name] += 1
+                self.wait_seconds[name] += now - waiter.enqueued
+                grants.append(waiter)
+
+        for waiter in grants:
+            waiter.loop.call_soon_threadsafe(self._resolve, waiter)
+        if timer is not None:
+            loop, delay = timer
+            loop.call_soon_threadsafe(loop.call_later, delay, self._on_timer)
+
+    def _resolve(self, waiter):
+        if waiter.future.done():
+            # 기다리던 쪽이 이미 취소되었으므로 슬롯을 돌려준다
+            self._release()
+        else:
+            waiter.future.set_result(None)
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer_deadline = None
+        self._dispatch()
+
+    @property
+    def limit(self):
+        return max(self.min_concurrency, int(self.window))
+
+    def on_success(self):
+        # 창 크기만큼 성공하면 1 증가 (additive increase)
+        with self._lock:
+            self.window = min(self.max_concurrency, self.window + 1.0 / self.window)
+        self._dispatch()
+
+    def on_overload(self, retry_after=None):
+        # 429, 타임아웃, 과부하 응답: 창을 절반으로 (multiplicative decrease)
+        now = time.monotonic()
+        with self._lock:
+            self.overloads += 1
+            if now - self._last_decrease >= AIMD_COOLDOWN:
+                self.window = max(self.min_concurrency, self.window * AIMD_DECREASE)
+                self._last_decrease = now
+                logger.warning(f"LLM overload, concurrency window -> {self.window:.1f}")
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+    def forget_session(self, session):
+        with self._lock:
+            self._session_tags.pop(session, None)
+
+    def stats(self):
+        with self._lock:
+            waiting = {name: 0 for name in PRIORITY_NAMES.values()}
+            sessions = set()
+            for priority, _, _, waiter in self._waiters:
+                if not waiter.future.done():
+                    waiting[PRIORITY_NAMES[priority]] += 1
+                    sessions.add(waiter.session)
+            return {
+                "in_flight": self.in_flight,
+                "window": round(self.window, 2),
+                "limit": self.limit,
+                "min_concurrency": self.min_concurrency,
+                "max_concurrency": self.max_concurrency,
+                "overloads": self.overloads,
+                "paused_seconds": round(
+                    max(0.0, self._paused_until - time.monotonic()), 2
+                ),
+                "waiting": waiting,
+                "waiting_sessions": len(sessions),
+                "granted": dict(self.granted),
+                "wait_seconds": {k: round(v, 3) for k, v in self.wait_seconds.items()},
+                "request_tokens": round(self.requests.tokens, 1),
+                "token_tokens": round(self.tokens.tokens, 1),
+            }
+
+
+scheduler = LLMScheduler(
+    rpm=int(os.getenv("LLM_RPM", "500")),
+    tpm=int(os.getenv("LLM_TPM", "200000")),
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "50")),
+    min_concurrency=int(os.getenv("LLM_MIN_CONCURRENCY", "1")),
+    initial_concurrency=int(os.getenv("LLM_INITIAL_CONCURRENCY", "10")),
+)
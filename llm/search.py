@@ -0,0 +1,226 @@
+import os
+import re
+import sqlite3
+import asyncio
+import logging
+import threading
+import unicodedata
+
+logger = logging.getLogger("Search")
+
+# 한글 음절/자모 연속 구간과 그 밖의 문자·숫자 연속 구간
+HANGUL_RUN = re.compile(r"[ᄀ-ᇿ㄰-㆏가-힣]+")
+WORD_RUN = re.compile(r"\w+")
+
+# 검색 결과 주변 문맥 길이
+SNIPPET_CHARS = 60
+
+
+def tokenize(text):
+    """한글은 2글자 n-gram, 그 밖의 단어는 소문자 단어 단위로 나눈 토큰 목록."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    tokens = []
+    for word in WORD_RUN.findall(text):
+        position = 0
+        for run in HANGUL_RUN.finditer(word):
+            if run.start() > position:
+                tokens.append(word[position : run.start()])
+            hangul = run.group()
+            if len(hangul) == 1:
+                tokens.append(hangul)
+            else:
+                tokens.extend(hangul[i : i + 2] for i in range(len(hangul) - 1))
+            position = run.end()
+        if position < len(word):
+            tokens.append(word[position:])
+    return tokens
+
+
+def node_text(node):
+    # 노드 본문으로 색인할 텍스트 (설명과 토픽 내용)
+    return "\n".join(
+        node[field]
+        for field in ("description", "content")
+        if isinstance(node.get(field), str)
+    )
+
+
+def make_snippet(text, query):
+    # 검색어가 처음 나오는 위치 주변의 문맥
+    lowered = text.lower()
+    position = -1
+    for word in sorted(query.lower().split(), key=len, reverse=True):
+        position = lowered.find(word)
+        if position >= 0:
+            break
+    if position < 0:
+        return text[:SNIPPET_CHARS * 2]
+    start = max(0, position - SNIPPET_CHARS)
+    end = min(len(text), position + SNIPPET_CHARS)
+    return ("…" if start > 0 else "") + text[start:end] + ("…" if end < len(text) else "")
+
+
+class SearchIndex:
+    """책 노드의 제목과 본문을 색인하는 SQLite FTS5 역색인.
+
+    토큰화는 tokenize() 로 미리 해서 공백으로 이어 붙인 문자열을 저장하고,
+    순위는 FTS5 의 bm25() 를 사용한다 (제목 가중치 2, 본문 1).
+    책을 저장하거나 바꿀 때 그 책의 행만 지우고 다시 넣는다.
+    FTS5 의 UNINDEXED 열로는 행을 찾을 때 테이블 전체를 읽으므로,
+    책별 rowid 를 search_rows 에 따로 두고 rowid 로 지운다.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+                title_tokens,
+                body_tokens,
+                owner,
+                book_id UNINDEXED,
+                uuid UNINDEXED,
+                level UNINDEXED,
+                title UNINDEXED,
+                body UNINDEXED,
+                tokenize = 'unicode61 remove_diacritics 0'
+            )
+            """
+        )
+        created = not self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_rows'"
+        ).fetchone()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_rows (book_id TEXT NOT NULL, row INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS search_rows_book ON search_rows (book_id)"
+        )
+        if created:
+            # 예전 색인 파일이면 기존 행의 rowid 를 한 번만 채움
+            self._conn.execute(
+                "INSERT INTO search_rows SELECT book_id, rowid FROM search_index"
+            )
+        self._conn.commit()
+
+    def _index_book(self, owner, book_id, nodes):
+        rows = []
+        for node in nodes:
+            fields = node["node"]
+            # 토픽은 제목 대신 name 필드를 사용
+            title = fields.get("title") or fields.get("name") or ""
+            body = node_text(fields)
+            rows.append(
+                (
+                    " ".join(tokenize(title)),
+                    " ".join(tokenize(body)),
+                    owner,
+                    book_id,
+                    node["uuid"],
+                    node["level"],
+                    title,
+                    body,
+                )
+            )
+        with self._lock:
+            self._delete_rows(book_id)
+            row_ids = []
+            for row in rows:
+                cursor = self._conn.execute(
+                    "INSERT INTO search_index VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row
+                )
+                row_ids.append((book_id, cursor.lastrowid))
+            self._conn.executemany("INSERT INTO search_rows VALUES (?, ?)", row_ids)
+            self._conn.commit()
+        return len(rows)
+
+    def _delete_rows(self, book_id):
+        # self._lock 안에서 호출
+        self._conn.execute(
+            """
+            DELETE FROM search_index WHERE rowid IN (
+                SELECT row FROM search_rows WHERE book_id = ?
+            )
+            """,
+            (book_id,),
+        )
+        self._conn.execute("DELETE FROM search_rows WHERE book_id = ?", (book_id,))
+
+    def _remove_book(self, book_id):
+        with self._lock:
+            self._delete_rows(book_id)
+            self._conn.commit()
+
+    def _search(self, owner, query, limit):
+        tokens = sorted(set(tokenize(query)))
+        if not tokens:
+            return []
+        terms = " OR ".join(f'"{token}"' for token in tokens)
+        match = f'owner : "{owner}" AND {{title_tokens body_tokens}} : ({terms})'
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT book_id, uuid, level, title, body,
+                       bm25(search_index, 2.0, 1.0, 0.0) AS score
+                FROM search_index
+                WHERE search_index MATCH ?
+                ORDER BY score
+                LIMIT ?
+                """,
+                (match, limit),
+            ).fetchall()
+        return [
+            {
+                "book_id": book_id,
+                "uuid": uuid,
+                "level": level,
+                "title": title,
+                "snippet": make_snippet(body, query),
+                "score": round(-score, 4),
+            }
+            for book_id, uuid, level, title, body, score in rows
+        ]
+
+    def _count(self):
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM search_index"
+            ).fetchone()
+        return count
+
+    async def index_book(self, owner, book_id, nodes):
+        try:
+            return await asyncio.to_thread(
+                self._index_book, str(owner), str(book_id), list(nodes)
+            )
+        except Exception as e:
+            logger.error(f"Error indexing book {book_id}: {e}")
+            return 0
+
+    async def remove_book(self, book_id):
+        try:
+            await asyncio.to_thread(self._remove_book, str(book_id))
+        except Exception as e:
+            logger.error(f"Error removing book {book_id} from search index: {e}")
+
+    async def search(self, owner, query, limit=20):
+        return await asyncio.to_thread(self._search, str(owner), query, limit)
+
+    async def count(self):
+        return await asyncio.to_thread(self._count)
+
+
+def create_search_index():
+    path = os.getenv("SEARCH_INDEX_PATH", "search_index.sqlite3")
+    if not path:
+        return None
+    try:
+        return SearchIndex(path)
+    except Exception as e:
+        logger.error(f"Error opening search index at {path}: {e}")
+        return None
+
+
+search_index = create_search_index()
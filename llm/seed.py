@@ -0,0 +1,183 @@
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+import logging
+import argparse
+
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger("Seed")
+
+# (파일, 제목, 설명) - 예전 initialize_data 가 넣던 예제 책
+SEED_BOOKS = [
+    ("data.json", "JPA Book", "JPA 관련 학습 자료"),
+    ("data2.json", "백엔드 개발", "백엔드 개발 관련 자료"),
+]
+
+CHUNK_SIZE = 64 * 1024
+
+# 예제 책을 소유하는 사용자 (SEED_OWNER_ID 가 없으면 SEED_OWNER_NAME 으로 만든 사용자)
+SEED_OWNER_ID = os.getenv("SEED_OWNER_ID")
+SEED_OWNER_NAME = os.getenv("SEED_OWNER_NAME", "예제")
+
+# 여러 워커가 동시에 시작해도 한 워커만 적재하도록 seed_versions 에 잡는 lease
+LEASE_ID = "_lease"
+SEED_LEASE_SECONDS = int(os.getenv("SEED_LEASE_SECONDS", "600"))
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_books(path):
+    """시드 파일의 최상위 책 목록.
+
+    최상위가 객체면 파일 전체가 책 한 권의 content 이고, 배열이면 각 원소가
+    {"title", "description", "content"} 형식의 책 한 권이다.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data if isinstance(data, list) else [data]
+
+
+def seed_book(value, title, description):
+    if "content" in value:
+        return {
+            "title": value.get("title", title),
+            "description": value.get("description", description),
+            "content": value["content"],
+        }
+    return {"title": title, "description": description, "content": value}
+
+
+async def acquire_lease(manifest, holder, seconds=SEED_LEASE_SECONDS):
+    # lease 가 없거나 만료되었을 때만 잡힘 (다른 워커가 잡고 있으면 upsert 가 _id 중복으로 실패)
+    now = datetime.now(timezone.utc)
+    try:
+        await manifest.find_one_and_update(
+            {"_id": LEASE_ID, "expires_at": {"$lt": now}},
+            {"$set": {"holder": holder, "expires_at": now + timedelta(seconds=seconds)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+async def release_lease(manifest, holder):
+    await manifest.delete_one({"_id": LEASE_ID, "holder": holder})
+
+
+async def seed_owner(users):
+    if SEED_OWNER_ID:
+        return ObjectId(SEED_OWNER_ID)
+    user = await users.find_one_and_update(
+        {"seed_owner": True},
+        {"$setOnInsert": {"name": SEED_OWNER_NAME, "book_count": 0}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return user["_id"]
+
+
+async def load_seed(store, manifest, owner, path, title, description, force=False):
+    """시드 파일 하나를 owner 의 책으로 적재. 저장된 해시와 같으면 건너뛰고, 적재한 책 수를 반환."""
+    name = os.path.basename(path)
+    digest = await asyncio.to_thread(file_sha256, path)
+    record = await manifest.find_one({"_id": name})
+    if (
+        record is not None
+        and record.get("sha256") == digest
+        and "book_ids" in record
+        and not force
+    ):
+        logger.info(f"Seed {name} is up to date, skipping")
+        return 0
+
+    # 예전 적재 방식이 사용자 컬렉션에 넣은 책 문서 정리 (사용자 문서에는 name 이 있음)
+    await store.users.delete_many(
+        {
+            "name": {"$exists": False},
+            "$or": [
+                {"seed": name},
+                {"seed": {"$exists": False}, "title": title, "description": description},
+            ],
+        }
+    )
+    for book_id in (record or {}).get("book_ids", []):
+        await store.delete(book_id)
+
+    # 파일 읽기와 파싱은 이벤트 루프 밖에서
+    values = await asyncio.to_thread(read_books, path)
+    books = [
+        seed_book(value, title, description)
+        for value in values
+        if isinstance(value, dict)
+    ]
+    # 파일의 책을 한 번의 bulk insert 로 저장
+    book_ids, errors = await store.create_many(owner, books) if books else ([], [])
+    for position, message in errors:
+        logger.error(f"Error loading book {position} of seed {name}: {message}")
+
+    # 모두 적재한 뒤에만 해시를 기록하므로 중간에 실패하면 다음 실행에서 다시 적재
+    # (일부 책이 실패했으면 해시를 비워 두어 다음 실행에서 다시 적재)
+    await manifest.replace_one(
+        {"_id": name},
+        {
+            "sha256": None if errors else digest,
+            "owner": owner,
+            "book_ids": book_ids,
+            "loaded_at": datetime.now(timezone.utc),
+        },
+        upsert=True,
+    )
+    logger.info(f"Loaded seed {name} as {len(book_ids)} books")
+    return len(book_ids)
+
+
+async def seed_all(db, store, base_dir=None, force=False):
+    base_dir = base_dir or os.path.dirname(os.path.abspath(__file__))
+    manifest = db["seed_versions"]
+    holder = str(uuid.uuid4())
+    if not await acquire_lease(manifest, holder):
+        logger.info("Another worker is loading seed data, skipping")
+        return {}
+
+    loaded = {}
+    try:
+        owner = await seed_owner(store.users)
+        for file_name, title, description in SEED_BOOKS:
+            path = os.path.join(base_dir, file_name)
+            if not os.path.exists(path):
+                logger.warning(f"Seed file {path} not found")
+                continue
+            loaded[file_name] = await load_seed(
+                store, manifest, owner, path, title, description, force
+            )
+    finally:
+        await release_lease(manifest, holder)
+    return loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="예제 책 시드 데이터를 MongoDB 에 적재")
+    parser.add_argument("--force", action="store_true", help="해시가 같아도 다시 적재")
+    parser.add_argument("--dir", default=None, help="시드 파일이 있는 디렉터리")
+    args = parser.parse_args()
+
+    from database import db
+    from books import BookStore
+    from search import search_index
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(seed_all(db, BookStore(db, search_index), args.dir, args.force))
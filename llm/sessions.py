@@ -0,0 +1,68 @@
+import json
+import time
+import uuid
+
+
+class Session:
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.created_at = time.time()
+        self.last_active = self.created_at
+        self.phase = "connected"
+
+    @property
+    def config(self):
+        # LangGraph 체크포인트를 세션별로 분리하는 설정
+        return {"configurable": {"thread_id": self.thread_id}}
+
+    def touch(self, phase=None):
+        self.last_active = time.time()
+        if phase is not None:
+            self.phase = phase
+
+    def to_dict(self):
+        now = time.time()
+        return {
+            "thread_id": self.thread_id,
+            "phase": self.phase,
+            "age_seconds": round(now - self.created_at, 1),
+            "idle_seconds": round(now - self.last_active, 1),
+        }
+
+
+class SessionRegistry:
+    # 현재 연결된 WebSocket 세션 목록
+    def __init__(self):
+        self._sessions = {}
+
+    def open(self, thread_id=None):
+        session = Session(thread_id or str(uuid.uuid4()))
+        self._sessions[session.thread_id] = session
+        return session
+
+    def close(self, thread_id):
+        return self._sessions.pop(thread_id, None)
+
+    def get(self, thread_id):
+        return self._sessions.get(thread_id)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    async def snapshot(self, graph=None):
+        sessions = []
+        for session in list(self._sessions.values()):
+            info = session.to_dict()
+            if graph is not None:
+                # 체크포인트에 저장된 상태를 직렬화한 크기로 세션별 메모리 사용량을 추정
+                state = await graph.aget_state(session.config)
+                info["state_bytes"] = len(
+                    json.dumps(state.values, default=str, ensure_ascii=False).encode(
+                        "utf-8"
+                    )
+                )
+            sessions.append(info)
+        return sessions
+
+
+session_registry = SessionRegistry()
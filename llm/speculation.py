@@ -0,0 +1,140 @@
+import os
+import asyncio
+import logging
+
+from events import current_channel
+
+logger = logging.getLogger("Speculation")
+
+# 연결이 끊긴 세션의 추측 실행을 재연결을 기다리며 남겨 두는 시간
+SPECULATION_TTL = float(os.getenv("SPECULATION_TTL", "300"))
+
+
+class BufferedChannel:
+    # 추측 실행 중에 만든 이벤트를 모아 두었다가, 세션이 이어지면 실제 채널로 넘기는 채널
+    def __init__(self):
+        self.events = []
+        self.target = None
+
+    @property
+    def closed(self):
+        return self.target is not None and self.target.closed
+
+    def emit(self, message):
+        if self.target is not None:
+            self.target.emit(message)
+        else:
+            self.events.append(message)
+
+    def attach(self, channel):
+        if channel is None:
+            return
+        self.target = channel
+        for message in self.events:
+            channel.emit(message)
+        self.events = []
+
+
+class Speculation:
+    def __init__(self, key, task, channel):
+        self.key = key
+        self.task = task
+        self.channel = channel
+        self.expiry = None
+
+
+class SpeculationRegistry:
+    """세션(thread_id) 별로 사용자 입력을 기다리는 동안 미리 시작한 작업.
+
+    작업 결과가 사용자의 선택과 무관할 때만 사용한다. key 는 작업이 기반한 상태를 나타내며,
+    이어서 진행할 때 key 가 다르면 결과를 버리고 처음부터 다시 실행한다.
+    작업이 보내는 이벤트는 결과를 가져갈 때까지 전송하지 않고 모아 둔다.
+    """
+
+    def __init__(self, ttl=SPECULATION_TTL):
+        self.ttl = ttl
+        self._running = {}
+        self.started = 0
+        self.used = 0
+        self.discarded = 0
+
+    def start(self, thread_id, key, coroutine_fn):
+        speculation = self._running.get(thread_id)
+        if speculation is not None:
+            # 재연결한 세션이 이미 시작한 작업을 이어서 쓰므로 만료 예약을 취소
+            if speculation.expiry is not None:
+                speculation.expiry.cancel()
+                speculation.expiry = None
+            return False
+        channel = BufferedChannel()
+
+        async def run():
+            # create_task 가 컨텍스트를 복사하므로 이 작업의 이벤트만 버퍼로 감
+            current_channel.set(channel)
+            return await coroutine_fn()
+
+        task = asyncio.create_task(run())
+        self._running[thread_id] = Speculation(key, task, channel)
+        self.started += 1
+        logger.info(f"Started speculative work for {thread_id}")
+        return True
+
+    async def take(self, thread_id, key):
+        # 이미 시작한 작업의 결과 (없거나, key 가 다르거나, 실패했으면 None)
+        speculation = self._running.pop(thread_id, None)
+        if speculation is None:
+            return None
+        if speculation.expiry is not None:
+            speculation.expiry.cancel()
+        if speculation.key != key:
+            self._cancel(thread_id, speculation, "state changed")
+            return None
+
+        speculation.channel.attach(current_channel.get())
+        try:
+            result = await speculation.task
+        except Exception as e:
+            logger.warning(f"Speculative work for {thread_id} failed: {e}")
+            self.discarded += 1
+            return None
+        self.used += 1
+        return result
+
+    def expire(self, thread_id, delay=None):
+        # 재연결을 기다렸다가 그때까지 이어지지 않으면 취소
+        speculation = self._running.get(thread_id)
+        if speculation is None:
+            return
+        if speculation.expiry is not None:
+            speculation.expiry.cancel()
+        speculation.expiry = asyncio.get_running_loop().call_later(
+            self.ttl if delay is None else delay, self.discard, thread_id
+        )
+
+    def discard(self, thread_id):
+        speculation = self._running.pop(thread_id, None)
+        if speculation is not None:
+            if speculation.expiry is not None:
+                speculation.expiry.cancel()
+            self._cancel(thread_id, speculation, "discarded")
+
+    def _cancel(self, thread_id, speculation, reason):
+        speculation.task.cancel()
+        # 취소 전에 끝나 버린 작업의 예외는 읽어서 경고가 남지 않도록 함
+        speculation.task.add_done_callback(
+            lambda task: task.cancelled() or task.exception()
+        )
+        self.discarded += 1
+        logger.info(f"Speculative work for {thread_id} {reason}")
+
+    def stats(self):
+        return {
+            "running": sum(1 for s in self._running.values() if not s.task.done()),
+            "ready": sum(1 for s in self._running.values() if s.task.done()),
+            "started": self.started,
+            "used": self.used,
+            "discarded": self.discarded,
+        }
+
+
+speculations = SpeculationRegistry()
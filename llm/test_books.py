@@ -0,0 +1,218 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import BulkWriteError
+
+import books
+from books import DERIVED_VERSION, BookStore
+
+
+def make_book(title, content):
+    return {"title": title, "description": f"{title} 설명", "content": content}
+
+
+def lesson_content(*topics):
+    return {
+        "subjects": [
+            {
+                "uuid": "s1",
+                "title": "과목",
+                "lessons": [
+                    {
+                        "uuid": "l1",
+                        "title": "레슨",
+                        "topics": [{"uuid": uuid, "name": name} for uuid, name in topics],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+@pytest.fixture
+def env():
+    db = AsyncMongoMockClient()["test"]
+    store = BookStore(db)
+
+    async def make_owner():
+        result = await db["books"].insert_one({"name": "사용자", "book_count": 0})
+        return result.inserted_id
+
+    return db, store, make_owner
+
+
+def node_uuids(db, book_id):
+    async def run():
+        cursor = db["book_nodes"].find({"book_id": book_id}, {"uuid": 1})
+        return [node["uuid"] for node in await cursor.to_list(None)]
+
+    return run()
+
+
+def test_create_stores_derived_data_and_nodes(env):
+    db, store, make_owner = env
+
+    async def run():
+        owner = await make_owner()
+        doc = await store.create(
+            owner, make_book("책", lesson_content(("t1", "토픽1"), ("t2", "토픽2")))
+        )
+        lesson = await store.node(doc["_id"], "l1", children=True)
+        return doc, await node_uuids(db, doc["_id"]), lesson
+
+    doc, uuids, lesson = asyncio.run(run())
+    assert doc["index"] == 0
+    assert doc["derived"] == DERIVED_VERSION
+    assert doc["stats"]["topics"] == 2
+    topics = doc["outline"][0]["children"][0]["children"]
+    assert [topic["title"] for topic in topics] == ["토픽1", "토픽2"]
+    assert sorted(uuids) == ["l1", "s1", "t1", "t2"]
+    assert [child["uuid"] for child in lesson["children"]] == ["t1", "t2"]
+
+
+def test_create_remints_duplicate_uuids(env):
+    db, store, make_owner = env
+
+    async def run():
+        owner = await make_owner()
+        doc = await store.create(
+            owner, make_book("책", lesson_content(("t1", "a"), ("t1", "b"), ("s1", "c")))
+        )
+        return doc, await node_uuids(db, doc["_id"])
+
+    doc, uuids = asyncio.run(run())
+    assert len(uuids) == len(set(uuids)) == 5
+    topics = doc["content"]["subjects"][0]["lessons"][0]["topics"]
+    assert topics[0]["uuid"] == "t1"
+    assert len({topic["uuid"] for topic in topics} | {"s1", "l1"}) == 5
+
+
+def test_create_removes_book_when_nodes_fail(env, monkeypatch):
+    db, store, make_owner = env
+
+    async def fail(documents):
+        raise BulkWriteError({"writeErrors": []})
+
+    async def run():
+        owner = await make_owner()
+        monkeypatch.setattr(store, "_write_nodes", fail)
+        with pytest.raises(BulkWriteError):
+            await store.create(owner, make_book("책", lesson_content(("t1", "a"))))
+        return await db["user_books"].count_documents({})
+
+    assert asyncio.run(run()) == 0
+
+
+def test_create_many_reports_books_with_bad_nodes(env, monkeypatch):
+    db, store, make_owner = env
+    # 중복 uuid 를 고치지 않으면 두 번째 책의 노드 쓰기가 실패함
+    monkeypatch.setattr(books, "dedupe_uuids", lambda content, seen=None: 0)
+
+    async def run():
+        owner = await make_owner()
+        good = lesson_content(("t1", "a"))
+        bad = lesson_content(("t1", "a"), ("t1", "b"))
+        ids, errors = await store.create_many(
+            owner,
+            [make_book("1", good), make_book("2", bad), make_book("3", good)],
+        )
+        titles = [book["title"] for book in await store.list(owner)]
+        stored = await db["user_books"].find({}, {"derived": 1}).to_list(None)
+        return ids, errors, titles, stored, await node_uuids(db, ids[1])
+
+    ids, errors, titles, stored, uuids = asyncio.run(run())
+    assert len(ids) == 2
+    assert [position for position, _ in errors] == [1]
+    assert titles == ["1", "3"]
+    assert all(book["derived"] == DERIVED_VERSION for book in stored)
+    assert sorted(uuids) == ["l1", "s1", "t1"]
+
+
+def test_backfill_repairs_and_skips_stored_books(env, monkeypatch):
+    db, store, make_owner = env
+
+    async def run():
+        owner = await make_owner()
+        # 파생 데이터 없이 저장된 예전 책 (하나는 uuid 가 중복)
+        await db["user_books"].insert_many(
+            [
+                {"owner": owner, "index": 0, **make_book("a", lesson_content(("t1", "x")))},
+                {
+                    "owner": owner,
+                    "index": 1,
+                    **make_book("b", lesson_content(("t1", "x"), ("t1", "y"))),
+                },
+                {"owner": owner, "index": 2, **make_book("c", lesson_content(("t9", "z")))},
+            ]
+        )
+        write_nodes = store._write_nodes
+
+        async def fail_third(documents):
+            documents = list(documents)
+            if any(document["uuid"] == "t9" for document in documents):
+                raise BulkWriteError({"writeErrors": []})
+            await write_nodes(documents)
+
+        monkeypatch.setattr(store, "_write_nodes", fail_third)
+        listed = await store.list(owner, {"title": 1, "outline": 1, "derived": 1})
+        repaired = await db["user_books"].find_one({"title": "b"})
+        return listed, await node_uuids(db, repaired["_id"])
+
+    listed, uuids = asyncio.run(run())
+    assert [book["title"] for book in listed] == ["a", "b", "c"]
+    assert [book.get("derived") for book in listed] == [
+        DERIVED_VERSION,
+        DERIVED_VERSION,
+        None,
+    ]
+    assert listed[0]["outline"][0]["children"][0]["children"][0]["title"] == "x"
+    assert len(uuids) == len(set(uuids)) == 4
+
+
+def test_list_page_uses_index_cursor(env):
+    db, store, make_owner = env
+
+    async def run():
+        owner = await make_owner()
+        await store.create_many(
+            owner, [make_book(str(i), lesson_content()) for i in range(5)]
+        )
+        first, cursor = await store.list_page(owner, limit=2)
+        second, last = await store.list_page(owner, after=cursor, limit=10)
+        user = await db["books"].find_one({"_id": owner})
+        return first, cursor, second, last, user
+
+    first, cursor, second, last, user = asyncio.run(run())
+    assert [book["title"] for book in first] == ["0", "1"]
+    assert cursor == 1
+    assert [book["title"] for book in second] == ["2", "3", "4"]
+    assert last is None
+    assert user["book_count"] == 5
+    assert set(first[0]) == {"_id", "index", "title", "description", "stats"}
+
+
+def test_replace_children(env):
+    db, store, make_owner = env
+
+    async def run():
+        owner = await make_owner()
+        doc = await store.create(owner, make_book("책", lesson_content(("t1", "a"))))
+        # 새 토픽 하나는 책의 다른 노드와 uuid 가 겹침
+        children = [{"uuid": "t2", "name": "b"}, {"uuid": "s1", "name": "c"}]
+        version = await store.replace_children(doc["_id"], "l1", "topics", children, 1)
+        stale = await store.replace_children(doc["_id"], "l1", "topics", [], 1)
+        lesson = await store.node(doc["_id"], "l1", True)
+        book = await store.get(doc["_id"], {"content": 1, "version": 1, "stats": 1})
+        return version, stale, lesson, book, await node_uuids(db, doc["_id"])
+
+    version, stale, lesson, book, uuids = asyncio.run(run())
+    assert version == 2
+    assert stale is None
+    assert book["version"] == 2
+    assert book["stats"]["topics"] == 2
+    names = [child["node"]["name"] for child in lesson["children"]]
+    assert names == ["b", "c"]
+    assert lesson["children"][1]["uuid"] != "s1"
+    assert "t1" not in uuids
+    assert len(uuids) == len(set(uuids)) == 4
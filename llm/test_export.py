@@ -0,0 +1,85 @@
+import json
+import asyncio
+
+from bson import ObjectId
+
+import export
+from books import COUNTED_LEVELS
+from export import iter_markdown, iter_ndjson, render_markdown
+
+BOOK = {
+    "_id": ObjectId(),
+    "title": "백엔드",
+    "description": "책 설명",
+    "content": {
+        "subjects": [
+            {
+                "uuid": "s1",
+                "title": "과목",
+                "description": "과목 설명",
+                "lessons": [
+                    {
+                        "uuid": "l1",
+                        "title": "레슨",
+                        "topics": [
+                            {"uuid": "t1", "name": "토픽1", "content": "본문1"},
+                            {"uuid": "t2", "name": "토픽2", "content": "본문2"},
+                        ],
+                    }
+                ],
+            },
+            {"uuid": "s2", "title": "두 번째 과목"},
+        ]
+    },
+}
+
+
+async def aiter(items):
+    for item in items:
+        yield item
+
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+def test_render_markdown_headings_and_order():
+    markdown = "".join(render_markdown(BOOK))
+    assert markdown == (
+        "# 백엔드\n\n책 설명\n\n"
+        "## 과목\n\n과목 설명\n\n"
+        "### 레슨\n\n"
+        "#### 토픽1\n\n본문1\n\n"
+        "#### 토픽2\n\n본문2\n\n"
+        "## 두 번째 과목\n\n"
+    )
+
+
+def test_render_markdown_caps_heading_depth():
+    node = {"title": "leaf"}
+    for level in reversed(COUNTED_LEVELS):
+        node = {"title": level, level: [node]}
+    markdown = "".join(render_markdown({"title": "책", "content": node}))
+    assert "###### leaf\n\n" in markdown
+    assert "####### " not in markdown
+
+
+def test_iter_markdown_separates_books_and_chunks(monkeypatch):
+    monkeypatch.setattr(export, "CHUNK_BYTES", 16)
+    chunks = asyncio.run(collect(iter_markdown(aiter([BOOK, BOOK]))))
+    assert len(chunks) > 1
+    markdown = b"".join(chunks).decode("utf-8")
+    assert markdown.count("---\n\n") == 2
+    assert markdown.count("#### 토픽2\n\n") == 2
+
+
+def test_iter_ndjson_round_trips_books():
+    chunks = asyncio.run(collect(iter_ndjson(aiter([BOOK]))))
+    assert chunks[0].endswith(b"\n")
+    line = json.loads(chunks[0])
+    assert line == {
+        "id": str(BOOK["_id"]),
+        "title": BOOK["title"],
+        "description": BOOK["description"],
+        "content": BOOK["content"],
+    }
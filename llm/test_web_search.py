@@ -0,0 +1,123 @@
+import os
+import asyncio
+
+import httpx
+
+# 테스트에서는 LLM 캐시 파일을 만들지 않음
+os.environ.setdefault("LLM_CACHE_PATH", "")
+
+import web_search
+from http_pool import HttpPool
+from web_search import SearchClient
+
+ENDPOINT = "http://search.test/customsearch/v1"
+
+
+class StubSearch:
+    # 검색어별 링크를 돌려주는 로컬 Custom Search 대역
+    def __init__(self, statuses=(), delay=0.0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.queries = []
+
+    async def __call__(self, request):
+        self.queries.append(request.url.params["q"])
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.statuses:
+            return httpx.Response(self.statuses.pop(0))
+        q = request.url.params["q"]
+        return httpx.Response(200, json={"items": [{"link": f"https://example.com/{q}"}]})
+
+
+def make_client(stub, **kwargs):
+    pool = HttpPool(transport=httpx.MockTransport(stub))
+    client = SearchClient(endpoint=ENDPOINT, api_key="k", cx="c", pool=pool, **kwargs)
+    return client, pool
+
+
+def test_cache_hit_uses_normalized_key():
+    stub = StubSearch()
+    client, pool = make_client(stub)
+
+    async def run():
+        first = await client.search_links("파이썬  Async", ["b.com", "a.com"])
+        second = await client.search_links("파이썬 async", ["a.com", "b.com"])
+        await pool.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second
+    assert stub.queries == ["파이썬  Async site:b.com OR site:a.com"]
+    assert client.stats()["hits"] == 1
+    assert client.stats()["misses"] == 1
+
+
+def test_concurrent_queries_share_one_request():
+    stub = StubSearch(delay=0.05)
+    client, pool = make_client(stub)
+
+    async def run():
+        results = await asyncio.gather(
+            *(client.search_links("rust", ["a.com"]) for _ in range(5))
+        )
+        await pool.close()
+        return results
+
+    results = asyncio.run(run())
+    assert len(stub.queries) == 1
+    assert all(links == results[0] for links in results)
+    assert client.stats()["shared"] == 4
+
+
+def test_pooled_client_is_reused():
+    stub = StubSearch()
+    client, pool = make_client(stub)
+
+    async def run():
+        await client.search_links("a", ["a.com"])
+        first = pool.client
+        await client.search_links("b", ["a.com"])
+        await client.search_links("c", ["a.com"])
+        same = pool.client is first
+        await pool.close()
+        return same
+
+    assert asyncio.run(run())
+    assert len(stub.queries) == 3
+    assert pool.clients_created == 1
+    assert pool.stats()["requests"] == 3
+
+
+def test_retries_then_caches(monkeypatch):
+    monkeypatch.setattr(web_search, "backoff_delay", lambda attempt, retry_after=None: 0)
+    stub = StubSearch(statuses=[429, 503])
+    client, pool = make_client(stub)
+
+    async def run():
+        links = await client.search_links("go", ["a.com"])
+        again = await client.search_links("go", ["a.com"])
+        await pool.close()
+        return links, again
+
+    links, again = asyncio.run(run())
+    assert links == again == ["https://example.com/go site:a.com"]
+    assert len(stub.queries) == 3
+    assert client.stats()["retries"] == 2
+
+
+def test_failure_is_not_cached(monkeypatch):
+    monkeypatch.setattr(web_search, "backoff_delay", lambda attempt, retry_after=None: 0)
+    stub = StubSearch(statuses=[403])
+    client, pool = make_client(stub)
+
+    async def run():
+        failed = await client.search_links("java", ["a.com"])
+        links = await client.search_links("java", ["a.com"])
+        await pool.close()
+        return failed, links
+
+    failed, links = asyncio.run(run())
+    assert failed == []
+    assert links == ["https://example.com/java site:a.com"]
+    assert client.stats()["errors"] == 1
@@ -0,0 +1,150 @@
+import os
+import asyncio
+import logging
+import unicodedata
+
+import httpx
+
+from http_pool import http_pool
+from llm_cache import MemoryTier
+from scheduler import backoff_delay
+
+logger = logging.getLogger("WebSearch")
+
+# 로컬 테스트 서버 등으로 바꿀 수 있는 Custom Search 주소
+CSE_ENDPOINT = os.getenv("CSE_ENDPOINT", "https://www.googleapis.com/customsearch/v1")
+CSE_API_KEY = os.getenv("CSE_API_KEY")
+CSE_ID = os.getenv("CSE_ID")
+
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "5"))
+SEARCH_MAX_RETRIES = int(os.getenv("SEARCH_MAX_RETRIES", "3"))
+# 같은 검색어의 결과를 재사용하는 시간(초)과 항목 수
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", str(60 * 60)))
+SEARCH_CACHE_MAX_ITEMS = int(os.getenv("SEARCH_CACHE_MAX_ITEMS", "1000"))
+
+# 다시 시도할 만한 응답 코드 (요청 한도 초과, 일시적인 서버 오류)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def normalize_query(query):
+    # 대소문자, 전각/반각, 공백 차이만 있는 검색어는 같은 검색어로 취급
+    return " ".join(unicodedata.normalize("NFKC", query or "").lower().split())
+
+
+def search_key(query, sites):
+    return (normalize_query(query), tuple(sorted(set(sites))))
+
+
+def retry_after_seconds(response):
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class SearchClient:
+    """Custom Search API 의 비동기 클라이언트.
+
+    공용 HTTP 클라이언트로 연결을 재사용하고, 일시적인 오류는 지수 백오프로 다시 시도한다.
+    결과 링크는 정규화한 검색어와 사이트 목록으로 SEARCH_CACHE_TTL 동안 캐시하며,
+    같은 검색이 동시에 들어오면 요청 하나의 결과를 함께 사용한다.
+    """
+
+    def __init__(
+        self,
+        endpoint=CSE_ENDPOINT,
+        api_key=CSE_API_KEY,
+        cx=CSE_ID,
+        timeout=SEARCH_TIMEOUT,
+        max_retries=SEARCH_MAX_RETRIES,
+        cache_ttl=SEARCH_CACHE_TTL,
+        cache_max_items=SEARCH_CACHE_MAX_ITEMS,
+        pool=http_pool,
+    ):
+        self.endpoint = endpoint
+        self.pool = pool
+        self.api_key = api_key
+        self.cx = cx
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.cache = MemoryTier(cache_max_items, cache_ttl)
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+
+    async def _request(self, query, sites):
+        site_query = " OR ".join(f"site:{site}" for site in sites)
+        params = {"key": self.api_key, "cx": self.cx, "q": f"{query} {site_query}"}
+        attempt = 0
+        while True:
+            self.requests += 1
+            retry_after = None
+            try:
+                response = await self.pool.get(
+                    self.endpoint, params=params, timeout=self.timeout
+                )
+                if response.status_code == 200:
+                    return [item["link"] for item in response.json().get("items", [])]
+                if response.status_code not in RETRY_STATUSES:
+                    raise RuntimeError(f"Search failed with status {response.status_code}")
+                retry_after = retry_after_seconds(response)
+                error = f"status {response.status_code}"
+            except httpx.TransportError as e:
+                error = repr(e)
+
+            if attempt >= self.max_retries:
+                raise RuntimeError(f"Search failed after {attempt + 1} attempts: {error}")
+            delay = backoff_delay(attempt, retry_after)
+            logger.warning(f"Search request failed ({error}), retrying in {delay:.1f}s")
+            self.retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def search_links(self, query, sites):
+        """검색 결과 링크 목록 (실패하면 빈 목록, 실패는 캐시하지 않음)."""
+        key = search_key(query, sites)
+        links = self.cache.get(key)
+        if links is not None:
+            self.hits += 1
+            return list(links)
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.shared += 1
+            return list(await asyncio.shield(pending))
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            links = await self._request(query, sites)
+            self.cache.put(key, links)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error searching {query!r}: {e}")
+            links = []
+        finally:
+            del self._pending[key]
+            # 요청이 취소되어 결과가 없더라도 기다리던 쪽은 빈 목록을 받음
+            future.set_result(links or [])
+        return list(links)
+
+    def stats(self):
+        return {
+            "endpoint": self.endpoint,
+            "cache_items": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+        }
+
+
+search_client = SearchClient()